@@ -0,0 +1,159 @@
+"""
+Decoding time and WER of the vectorized log-space CTC prefix beam search against the previous
+dict-based implementation. Decodes DeepSpeech2 outputs on a data split of the hw_asr config when
+a checkpoint is given, otherwise synthetic frame distributions around random alignments of random texts.
+
+python -m benchmarks.ctc_beam_search -c hw_asr/configs/config2.json --asr_checkpoint path_to_asr_checkpoint --split test-clean
+python -m benchmarks.ctc_beam_search --utterances 32 --beam_size 10
+"""
+import argparse
+import json
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from hw_asr.base.base_text_encoder import BaseTextEncoder
+from hw_asr.metric.utils import calc_wer
+from hw_asr.text_encoder.ctc_char_text_encoder import CTCCharTextEncoder
+
+
+def legacy_ctc_beam_search(text_encoder, probs, beam_size):
+    """CTCCharTextEncoder.ctc_beam_search before it became vectorized."""
+
+    def extend_and_merge(frame, state):
+        new_state = defaultdict(float)
+        for next_char_index, next_char_proba in enumerate(frame):
+            for (pref, last_char), pref_proba in state.items():
+                next_char = text_encoder.ind2char[next_char_index]
+                if next_char == last_char:
+                    new_pref = pref
+                else:
+                    if next_char != text_encoder.EMPTY_TOK:
+                        new_pref = pref + next_char
+                    else:
+                        new_pref = pref
+                    last_char = next_char
+                new_state[(new_pref, last_char)] += pref_proba * next_char_proba
+        return new_state
+
+    def truncate(state, beam_size):
+        state_list = list(state.items())
+        state_list.sort(key=lambda x: -x[1])
+        return dict(state_list[:beam_size])
+
+    state = {("", text_encoder.EMPTY_TOK): 1.0}
+    for frame in probs:
+        state = extend_and_merge(frame, state)
+        state = truncate(state, beam_size)
+    state_list = list(state.items())
+    state_list.sort(key=lambda x: -x[1])
+    return state_list[0][0][0]
+
+
+def synthetic_outputs(text_encoder, args):
+    """
+    Log-probabilities peaked at a random alignment of a random text, every frame is noisy.
+    """
+    rng = np.random.default_rng(0)
+    alphabet = [char for char in text_encoder.alphabet if char != " "]
+    blank = text_encoder.char2ind[text_encoder.EMPTY_TOK]
+    utterances = []
+    for _ in range(args.utterances):
+        words = ["".join(rng.choice(alphabet, size=rng.integers(2, 8))) for _ in range(rng.integers(5, 15))]
+        text = " ".join(words)
+        path = []
+        for char in text:
+            path += [text_encoder.char2ind[char]] * int(rng.integers(1, 4)) + [blank] * int(rng.integers(0, 3))
+        logits = args.noise * rng.standard_normal((len(path), len(text_encoder.ind2char)))
+        logits[np.arange(len(path)), path] += 5
+        utterances.append((logits - np.logaddexp.reduce(logits, axis=-1, keepdims=True), text))
+    return utterances
+
+
+def model_outputs(text_encoder, args):
+    """
+    DeepSpeech2 log-probabilities on the data split of the hw_asr config.
+    """
+    import hw_asr.model as module_arch
+    from hw_asr.utils.object_loading import get_dataloaders
+    from hw_asr.utils.parse_config import ConfigParser
+
+    with Path(args.config).open() as f:
+        config = json.load(f)
+    config["data"] = {args.split: config["data"][args.split]}
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    utterances = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        config["trainer"]["save_dir"] = tmp_dir
+        config = ConfigParser(config, run_id="")
+        dataloader = get_dataloaders(config, text_encoder)[args.split]
+        model = config.init_obj(config["arch"], module_arch, n_class=len(text_encoder))
+        model.load_state_dict(torch.load(args.asr_checkpoint, map_location="cpu")["state_dict"])
+        model = model.to(device).eval()
+        with torch.no_grad():
+            for batch in dataloader:
+                spectrogram = batch["spectrogram"].to(device)
+                log_probs = F.log_softmax(model(spectrogram=spectrogram, spectrogram_length=batch["spectrogram_length"])["logits"], dim=-1)
+                lengths = model.transform_input_lengths(batch["spectrogram_length"])
+                for log_prob, length, text in zip(log_probs.cpu().numpy(), lengths.numpy(), batch["text"]):
+                    utterances.append((log_prob[:length], BaseTextEncoder.normalize_text(text)))
+                if len(utterances) >= args.utterances:
+                    break
+    return utterances[: args.utterances]
+
+
+def measure(decode, utterances):
+    start_time = time.perf_counter()
+    pred_texts = [decode(log_probs) for log_probs, _ in utterances]
+    decode_time = (time.perf_counter() - start_time) / len(utterances)
+    wer = np.mean([calc_wer(text, pred_text) for (_, text), pred_text in zip(utterances, pred_texts)])
+    return decode_time, wer
+
+
+def main(args):
+    # no language model, the decoder uses only the alphabet
+    text_encoder = CTCCharTextEncoder()
+    utterances = model_outputs(text_encoder, args) if args.asr_checkpoint is not None else synthetic_outputs(text_encoder, args)
+
+    results = {
+        "argmax": lambda log_probs: text_encoder.ctc_decode(log_probs.argmax(-1)),
+        "legacy beam search": lambda log_probs: legacy_ctc_beam_search(text_encoder, np.exp(log_probs), args.beam_size),
+        "prefix beam search": lambda log_probs: text_encoder.ctc_prefix_beam_search(log_probs, args.beam_size)[0].text,
+        f"prefix beam search, top {args.top_k}": lambda log_probs: text_encoder.ctc_prefix_beam_search(log_probs, args.beam_size, args.top_k)[0].text,
+    }
+
+    frames = np.mean([len(log_probs) for log_probs, _ in utterances])
+    print(f"{len(utterances)} utterances, {frames:.0f} frames on average, beam size {args.beam_size}")
+    for name, decode in results.items():
+        decode_time, wer = measure(decode, utterances)
+        print(f"{name:30s} {1000 * decode_time:.1f} ms/utterance, WER: {100 * wer:.2f}%")
+
+    # all utterances in one padded batch
+    lengths = [len(log_probs) for log_probs, _ in utterances]
+    batch = np.zeros((len(utterances), max(lengths), len(text_encoder.ind2char)), dtype=np.float32)
+    for i, (log_probs, _) in enumerate(utterances):
+        batch[i, : len(log_probs)] = log_probs
+    start_time = time.perf_counter()
+    pred_texts = text_encoder.ctc_beam_search_batch(batch, lengths, args.beam_size, args.top_k)
+    decode_time = (time.perf_counter() - start_time) / len(utterances)
+    wer = np.mean([calc_wer(text, pred_text) for (_, text), pred_text in zip(utterances, pred_texts)])
+    print(f"{f'batched, top {args.top_k}':30s} {1000 * decode_time:.1f} ms/utterance, WER: {100 * wer:.2f}%")
+
+
+if __name__ == "__main__":
+    args = argparse.ArgumentParser(description="CTC beam search benchmark")
+    args.add_argument("-c", "--config", default="hw_asr/configs/config2.json", type=str, help="Path to hw_asr config")
+    args.add_argument("--asr_checkpoint", default=None, type=str, help="Path to DeepSpeech2 checkpoint, synthetic outputs are decoded without it")
+    args.add_argument("--split", default="test-clean", type=str, help="Data split of config to decode")
+    args.add_argument("-n", "--utterances", default=32, type=int, help="Number of decoded utterances")
+    args.add_argument("--beam_size", default=10, type=int, help="Beam size")
+    args.add_argument("--top_k", default=8, type=int, help="Number of characters extending prefixes at every frame")
+    args.add_argument("--noise", default=1.0, type=float, help="Standard deviation of synthetic logits noise")
+    args = args.parse_args()
+
+    main(args)
@@ -0,0 +1,87 @@
+"""
+Step time and memory overhead of the weights EMA (trainer.ema in config) on synthetic SpEx+ batches.
+
+python -m benchmarks.ema -c src/configs/kaggle.json --steps 20 -b 4
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+import torch
+
+import src.loss as module_loss
+import src.model as module_arch
+from benchmarks.precision import get_batch, synchronize
+from src.utils.ema import ModelEMA
+from src.utils.parse_config import ConfigParser
+
+
+def run(config, args, device, ema_args):
+    torch.manual_seed(0)
+    model = ConfigParser.init_obj(config["arch"], module_arch, speakers_cnt=args.speakers_cnt).to(device).train()
+    criterion = ConfigParser.init_obj(config["loss"], module_loss).to(device)
+    optimizer = torch.optim.AdamW(model.parameters(), lr=1e-4)
+    batch = get_batch(args.batch_size, args.seconds, config["preprocessing"]["sr"], args.speakers_cnt, device)
+    if device.type == "cuda":
+        torch.cuda.reset_peak_memory_stats(device)
+    ema = ModelEMA(model, **ema_args) if ema_args is not None else None
+
+    def step():
+        loss = criterion(**batch, **model(**batch))
+        loss.backward()
+        if ema is not None:
+            ema.wait()
+        optimizer.step()
+        if ema is not None:
+            ema.update()
+        optimizer.zero_grad()
+
+    # warmup
+    step()
+    synchronize(device)
+    start_time = time.perf_counter()
+    for _ in range(args.steps):
+        step()
+    synchronize(device)
+    step_time = (time.perf_counter() - start_time) / args.steps
+    peak_memory = torch.cuda.max_memory_allocated(device) / 2**20 if device.type == "cuda" else float("nan")
+    return step_time, peak_memory
+
+
+def main(config, args):
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    modes = {
+        "no EMA": None,
+        "EMA every step": {"decay": 0.999, "update_every": 1},
+        f"EMA every {args.update_every} steps": {"decay": 0.999, "update_every": args.update_every},
+    }
+    if device.type == "cuda":
+        modes["EMA every step, side stream"] = {"decay": 0.999, "update_every": 1, "side_stream": True}
+
+    print(f"device: {device}, batch size: {args.batch_size}, {args.seconds} s")
+    baseline_time, baseline_memory = None, None
+    for name, ema_args in modes.items():
+        step_time, peak_memory = run(config, args, device, ema_args)
+        if baseline_time is None:
+            baseline_time, baseline_memory = step_time, peak_memory
+        print(
+            f"{name:30s} step time: {1000 * step_time:.1f} ms (+{100 * (step_time / baseline_time - 1):.1f}%), "
+            f"peak memory: {peak_memory:.0f} MB (+{peak_memory - baseline_memory:.0f} MB)"
+        )
+
+
+if __name__ == "__main__":
+    args = argparse.ArgumentParser(description="Weights EMA benchmark")
+    args.add_argument("-c", "--config", default="src/configs/kaggle.json", type=str, help="Path to config with arch and loss")
+    args.add_argument("--steps", default=20, type=int, help="Number of measured training steps")
+    args.add_argument("-b", "--batch_size", default=4, type=int, help="Batch size")
+    args.add_argument("-s", "--seconds", default=3.0, type=float, help="Length of mixtures and references in seconds")
+    args.add_argument("-k", "--update_every", default=4, type=int, help="EMA update period of the sparse mode")
+    args.add_argument("--speakers_cnt", default=251, type=int, help="Number of speakers of the classification head")
+    args = args.parse_args()
+
+    with Path(args.config).open() as f:
+        config = json.load(f)
+
+    main(config, args)
@@ -0,0 +1,68 @@
+"""
+Per-item feature extraction cost of BaseDataset.process_wave with the spectrogram transform built for every item
+against the transform built once per dataset.
+
+python -m benchmarks.feature_extraction -c test_model/config.json -n 200 -s 5
+"""
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+
+import torch
+import torchaudio
+
+from src.base.base_dataset import BaseDataset
+from src.utils.parse_config import ConfigParser
+
+
+def process_wave_rebuilt(dataset, audio_tensor_wave):
+    """BaseDataset.process_wave before the transform was cached."""
+    with torch.no_grad():
+        wave2spec = dataset.config_parser.init_obj(dataset.config_parser["preprocessing"]["spectrogram"], torchaudio.transforms)
+        audio_tensor_spec = wave2spec(audio_tensor_wave)
+        if dataset.log_spec:
+            audio_tensor_spec = torch.log(audio_tensor_spec + 1e-5)
+        return audio_tensor_wave, audio_tensor_spec
+
+
+def measure(process_wave, waves):
+    # warmup
+    process_wave(waves[0])
+    start_time = time.perf_counter()
+    for wave in waves:
+        process_wave(wave)
+    return (time.perf_counter() - start_time) / len(waves)
+
+
+def main(config, args):
+    torch.manual_seed(0)
+    waves = [torch.randn(1, int(args.seconds * config["preprocessing"]["sr"])) for _ in range(args.items)]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        config["trainer"]["save_dir"] = tmp_dir
+        dataset = BaseDataset([], ConfigParser(config, run_id=""))
+
+        results = {
+            "transform per item": measure(lambda wave: process_wave_rebuilt(dataset, wave), waves),
+            "cached transform": measure(dataset.process_wave, waves),
+        }
+
+    print(f"{config['preprocessing']['spectrogram']['type']}, {args.items} items, {args.seconds} s")
+    for name, item_time in results.items():
+        print(f"{name:20s} {1000 * item_time:.2f} ms/item")
+
+
+if __name__ == "__main__":
+    args = argparse.ArgumentParser(description="Feature extraction benchmark")
+    args.add_argument("-c", "--config", default="test_model/config.json", type=str, help="Path to config with preprocessing.spectrogram")
+    args.add_argument("-n", "--items", default=200, type=int, help="Number of processed items")
+    args.add_argument("-s", "--seconds", default=5.0, type=float, help="Length of items in seconds")
+    args.add_argument("-t", "--threads", default=1, type=int, help="Number of torch threads, dataloader workers use one")
+    args = args.parse_args()
+
+    torch.set_num_threads(args.threads)
+    with Path(args.config).open() as f:
+        config = json.load(f)
+
+    main(config, args)
@@ -0,0 +1,54 @@
+"""
+Import time of the entry points, summarized from `python -X importtime`. Every import runs in a fresh
+interpreter, the slowest top-level packages show which dependencies are loaded eagerly.
+
+python -m benchmarks.import_time --top 15
+"""
+import argparse
+import subprocess
+import sys
+from collections import defaultdict
+
+ENTRY_POINTS = ["train", "test", "create_dataset", "export"]
+
+
+def import_time(module):
+    """
+    :return: total import time in seconds and cumulative time of every top-level package in seconds.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr}")
+
+    packages = defaultdict(float)
+    total = 0
+    # lines look like "import time:       self [us] |  cumulative | imported package"
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        # nested imports are indented, only top-level ones add up to the total
+        if name.startswith("  "):
+            continue
+        package = name.strip().split(".")[0]
+        packages[package] += int(cumulative) / 1e6
+        total += int(cumulative) / 1e6
+    return total, packages
+
+
+def main(args):
+    for module in args.modules:
+        total, packages = min((import_time(module) for _ in range(args.repeats)), key=lambda result: result[0])
+        print(f"import {module}: {total:.2f} s")
+        for package, package_time in sorted(packages.items(), key=lambda item: -item[1])[: args.top]:
+            print(f"    {package:30s} {package_time:.3f} s")
+
+
+if __name__ == "__main__":
+    args = argparse.ArgumentParser(description="Entry points import time benchmark")
+    args.add_argument("-m", "--modules", default=ENTRY_POINTS, nargs="+", help="Modules to import")
+    args.add_argument("--top", default=10, type=int, help="Number of the slowest top-level packages to show")
+    args.add_argument("-n", "--repeats", default=3, type=int, help="Number of imports of every module, the fastest one is reported")
+    args = args.parse_args()
+
+    main(args)
@@ -0,0 +1,112 @@
+"""
+Replays MixtureDataset test items against a running serve.py instance from concurrent clients.
+
+python serve.py --workers 4 --threads 1 --pin_cores
+python -m benchmarks.load_generator -c test_model/config.json -n 200 --concurrency 16
+"""
+import argparse
+import http.client
+import json
+import socket
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+import src.datasets
+from src.datasets.mixture_dataset import get_speaker_id_by_path
+from src.inference.server import decode_audio, encode_audio
+from src.utils.parse_config import ConfigParser
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout=60):
+        super().__init__("localhost", timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+def make_connection(args):
+    if args.unix_socket is not None:
+        return UnixHTTPConnection(args.unix_socket)
+    return http.client.HTTPConnection(args.host, args.port, timeout=60)
+
+
+def request(connection, method, path, body=None):
+    connection.request(method, path, body=json.dumps(body) if body is not None else None, headers={"Content-Type": "application/json"})
+    response = connection.getresponse()
+    return response.status, json.loads(response.read())
+
+
+def main(config, args):
+    dataset = ConfigParser.init_obj(config["data"]["test"]["datasets"][0], src.datasets, config_parser=config)
+    bodies = []
+    for i in range(min(args.n_items, len(dataset))):
+        item = dataset[i]
+        body = {"mixture": encode_audio(item["y_wav"][0].numpy())}
+        if args.speaker_ids:
+            body["speaker_id"] = get_speaker_id_by_path(dataset._index[3 * i])
+        else:
+            body["reference"] = encode_audio(item["x_wav"][0].numpy())
+        bodies.append((body, item["y_wav"].shape[1]))
+
+    latencies, errors = [], []
+    lock = threading.Lock()
+    next_item = iter(range(args.n_requests or len(bodies)))
+
+    def client():
+        connection = make_connection(args)
+        while True:
+            with lock:
+                i = next(next_item, None)
+            if i is None:
+                break
+            body, length = bodies[i % len(bodies)]
+            start_time = time.perf_counter()
+            status, response = request(connection, "POST", "/extract", body)
+            latency = time.perf_counter() - start_time
+            with lock:
+                if status == 200 and len(decode_audio(response["s1"])) == length:
+                    latencies.append(latency)
+                else:
+                    errors.append(response.get("error", status))
+
+    start_time = time.perf_counter()
+    clients = [threading.Thread(target=client) for _ in range(args.concurrency)]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    total_time = time.perf_counter() - start_time
+
+    latencies = np.array(latencies) * 1000
+    print(f"{len(latencies)} requests in {total_time:.2f}s, {len(latencies) / total_time:.2f} requests/s, {len(errors)} errors")
+    if len(latencies):
+        print(f"client latency p50: {np.percentile(latencies, 50):.1f}ms, p99: {np.percentile(latencies, 99):.1f}ms")
+    if errors:
+        print(f"first error: {errors[0]}")
+    _, server_metrics = request(make_connection(args), "GET", "/metrics")
+    print(f"server metrics: {server_metrics}")
+
+
+if __name__ == "__main__":
+    args = argparse.ArgumentParser(description="serve.py load generator")
+    args.add_argument("-c", "--config", default="test_model/config.json", type=str, help="Path to config")
+    args.add_argument("--host", default="127.0.0.1", type=str, help="Server host")
+    args.add_argument("-p", "--port", default=8000, type=int, help="Server port")
+    args.add_argument("--unix_socket", default=None, type=str, help="Server unix socket")
+    args.add_argument("-n", "--n_items", default=100, type=int, help="Number of distinct test items to replay")
+    args.add_argument("--n_requests", default=None, type=int, help="Total number of requests (default: one per item)")
+    args.add_argument("--concurrency", default=8, type=int, help="Number of concurrent clients")
+    args.add_argument("--speaker_ids", action="store_true", help="Send enrolled speaker ids instead of references")
+    args = args.parse_args()
+
+    with Path(args.config).open() as f:
+        config = json.load(f)
+
+    main(config, args)
@@ -0,0 +1,75 @@
+"""
+Measures training steps/s with the pandas-backed tracker fed by `.item()` values (host sync every step)
+against the device-side MetricTracker.
+
+python -m benchmarks.metric_tracker --steps 200
+"""
+import argparse
+import time
+
+import pandas as pd
+import torch
+from torch import nn
+
+from src.utils import MetricTracker
+
+
+class PandasMetricTracker:
+    """MetricTracker before it became device-side."""
+
+    def __init__(self, *keys):
+        self._data = pd.DataFrame(index=keys, columns=["total", "counts", "average"])
+        for col in self._data.columns:
+            self._data[col].values[:] = 0
+
+    def update(self, key, value, n=1):
+        self._data.total[key] += value * n
+        self._data.counts[key] += n
+        self._data.average[key] = self._data.total[key] / self._data.counts[key]
+
+    def result(self):
+        return dict(self._data.average)
+
+
+def run(tracker, sync, model, optimizer, batch, steps, log_step, device):
+    keys = ["loss", "SI-SDR", "accuracy"]
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+    start_time = time.perf_counter()
+    for step in range(steps):
+        out = model(batch)
+        loss = out.pow(2).mean()
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+        for key, value in zip(keys, [loss, out.mean(), out.std()]):
+            tracker.update(key, value.item() if sync else value.detach())
+        if step % log_step == 0:
+            tracker.result()
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+    return steps / (time.perf_counter() - start_time)
+
+
+def main(args):
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    model = nn.Sequential(*[nn.Conv1d(256, 256, 1) for _ in range(args.layers)]).to(device)
+    optimizer = torch.optim.AdamW(model.parameters())
+    batch = torch.randn(args.batch_size, 256, 1000, device=device)
+
+    # warmup
+    run(MetricTracker("loss", "SI-SDR", "accuracy"), False, model, optimizer, batch, 10, args.log_step, device)
+    legacy = run(PandasMetricTracker("loss", "SI-SDR", "accuracy"), True, model, optimizer, batch, args.steps, args.log_step, device)
+    device_side = run(MetricTracker("loss", "SI-SDR", "accuracy"), False, model, optimizer, batch, args.steps, args.log_step, device)
+    print(f"device: {device}")
+    print(f"pandas tracker, .item() every step: {legacy:.2f} steps/s")
+    print(f"device-side tracker:                {device_side:.2f} steps/s")
+
+
+if __name__ == "__main__":
+    args = argparse.ArgumentParser(description="MetricTracker benchmark")
+    args.add_argument("--steps", default=200, type=int, help="Number of training steps")
+    args.add_argument("--log_step", default=100, type=int, help="Read averages every log_step steps")
+    args.add_argument("--batch_size", default=8, type=int, help="Batch size")
+    args.add_argument("--layers", default=8, type=int, help="Number of 1x1 conv layers of the toy model")
+    main(args.parse_args())
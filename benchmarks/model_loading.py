@@ -0,0 +1,62 @@
+"""
+Cold start time and peak RSS of loading a training checkpoint against the slim weights-only export.
+Every load runs in a fresh process.
+
+python -m benchmarks.model_loading -c test_model/config.json --ss_checkpoint test_model/ss_checkpoint.pth
+"""
+import argparse
+import json
+import multiprocessing as mp
+import resource
+import tempfile
+import time
+from pathlib import Path
+
+import torch
+
+
+def load(config, checkpoint_path, result_queue):
+    from src.inference.utils import load_ss_model
+
+    start_time = time.perf_counter()
+    load_ss_model(config, checkpoint_path, torch.device("cpu"))
+    # ru_maxrss is in kilobytes on linux
+    result_queue.put((time.perf_counter() - start_time, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+
+
+def measure(config, checkpoint_path, repeats):
+    ctx = mp.get_context("spawn")
+    results = []
+    for _ in range(repeats):
+        result_queue = ctx.Queue()
+        process = ctx.Process(target=load, args=(config, checkpoint_path, result_queue))
+        process.start()
+        results.append(result_queue.get())
+        process.join()
+    return min(load_time for load_time, _ in results), max(rss for _, rss in results)
+
+
+def main(config, args):
+    from src.inference.utils import export_weights, load_ss_model
+
+    results = {"training checkpoint": measure(config, args.ss_checkpoint, args.repeats)}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        weights_path = str(Path(tmp_dir) / "ss_weights.pth")
+        export_weights(load_ss_model(config, args.ss_checkpoint, torch.device("cpu")), config["ss_arch"], weights_path)
+        results["weights-only, mmap"] = measure(config, weights_path, args.repeats)
+
+    for name, (load_time, rss) in results.items():
+        print(f"{name:25s} load time: {1000 * load_time:.1f} ms, peak RSS: {rss:.1f} MB")
+
+
+if __name__ == "__main__":
+    args = argparse.ArgumentParser(description="Model loading benchmark")
+    args.add_argument("-c", "--config", default="test_model/config.json", type=str, help="Path to config")
+    args.add_argument("--ss_checkpoint", default="test_model/ss_checkpoint.pth", type=str, help="Path to speech separation checkpoint")
+    args.add_argument("-n", "--repeats", default=3, type=int, help="Number of loads of every format")
+    args = args.parse_args()
+
+    with Path(args.config).open() as f:
+        config = json.load(f)
+
+    main(config, args)
@@ -0,0 +1,69 @@
+"""
+Compares eager PyTorch and ONNX Runtime cpu inference of SpEx+ on the MixtureDataset test split.
+
+python -m benchmarks.onnx_runtime -c test_model/config.json --ss_checkpoint test_model/ss_checkpoint.pth -n 100 -t 1
+"""
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+
+import torch
+
+import src.datasets
+from src.collate_fn.ss_collate import ss_collate_fn
+from src.inference import OnnxSpExPlus, export_onnx, load_ss_model
+from src.metric.si_sdr_metric import SISDRMetric
+from src.utils.parse_config import ConfigParser
+
+
+@torch.no_grad()
+def run(model, batches, sr):
+    si_sdr = SISDRMetric()
+    total_time, total_audio, total_si_sdr = 0.0, 0.0, 0.0
+    for batch in batches:
+        start_time = time.perf_counter()
+        s1 = model(**batch)["s1"]
+        total_time += time.perf_counter() - start_time
+        total_audio += batch["y_wav"].shape[-1] / sr
+        total_si_sdr += si_sdr(s1=s1, target_wav=batch["target_wav"])
+    return {
+        "latency, ms": 1000 * total_time / len(batches),
+        "real time factor": total_time / total_audio,
+        "SI-SDR": total_si_sdr / len(batches),
+    }
+
+
+def main(config, args):
+    torch.set_num_threads(args.threads)
+    dataset = config.init_obj(config["data"]["test"]["datasets"][0], src.datasets, config_parser=config)
+    batches = [ss_collate_fn([dataset[i]]) for i in range(min(args.n_items, len(dataset)))]
+    sr = config["preprocessing"]["sr"]
+
+    model = load_ss_model(config, args.ss_checkpoint, torch.device("cpu"))
+    results = {"torch eager": run(model, batches, sr)}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        onnx_path = str(Path(tmp_dir) / "ss_model.onnx")
+        export_onnx(model, onnx_path, sr=sr)
+        for level in ["basic", "all"]:
+            onnx_model = OnnxSpExPlus(onnx_path, intra_op_num_threads=args.threads, inter_op_num_threads=1, optimization_level=level)
+            results[f"onnxruntime ({level} optimizations)"] = run(onnx_model, batches, sr)
+
+    print(f"{len(batches)} items, {args.threads} intra-op threads")
+    for backend, result in results.items():
+        print(f"{backend:40s} " + ", ".join(f"{name}: {value:.4f}" for name, value in result.items()))
+
+
+if __name__ == "__main__":
+    args = argparse.ArgumentParser(description="ONNX Runtime benchmark")
+    args.add_argument("-c", "--config", default="test_model/config.json", type=str, help="Path to config")
+    args.add_argument("--ss_checkpoint", default="test_model/ss_checkpoint.pth", type=str, help="Path to speech separation checkpoint")
+    args.add_argument("-n", "--n_items", default=100, type=int, help="Number of test items")
+    args.add_argument("-t", "--threads", default=1, type=int, help="Number of intra-op threads")
+    args = args.parse_args()
+
+    with Path(args.config).open() as f:
+        config = ConfigParser(json.load(f))
+
+    main(config, args)
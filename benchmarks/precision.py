@@ -0,0 +1,99 @@
+"""
+Training throughput and SI-SDR parity of SpEx+ precision policies (trainer.precision in config)
+on synthetic batches.
+
+python -m benchmarks.precision -c src/configs/kaggle.json --steps 20 -b 4
+"""
+import argparse
+import copy
+import json
+import time
+from pathlib import Path
+
+import torch
+
+import src.loss as module_loss
+import src.model as module_arch
+from src.metric.utils import si_sdr
+from src.utils.parse_config import ConfigParser
+from src.utils.precision import AUTOCAST_DTYPES, autocast, resolve_precision
+
+
+def get_batch(batch_size, seconds, sr, speakers_cnt, device):
+    y_len, x_len = int(seconds * sr), int(seconds * sr)
+    return {
+        "y_wav": torch.randn(batch_size, y_len, device=device),
+        "y_wav_len": torch.full((batch_size,), y_len, device=device),
+        "x_wav": torch.randn(batch_size, x_len, device=device),
+        "x_wav_len": torch.full((batch_size,), x_len, device=device, dtype=torch.float32),
+        "target_wav": torch.randn(batch_size, y_len, device=device),
+        "speaker_id": torch.randint(speakers_cnt, (batch_size,), device=device),
+    }
+
+
+def synchronize(device):
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+
+
+def run(model, criterion, batch, precision, steps, device):
+    model = copy.deepcopy(model).train()
+    optimizer = torch.optim.AdamW(model.parameters(), lr=1e-4)
+    scaler = torch.cuda.amp.GradScaler(enabled=precision == "fp16")
+
+    def step():
+        with autocast(precision, device):
+            loss = criterion(**batch, **model(**batch))
+        scaler.scale(loss).backward()
+        scaler.step(optimizer)
+        scaler.update()
+        optimizer.zero_grad()
+
+    # warmup
+    step()
+    synchronize(device)
+    start_time = time.perf_counter()
+    for _ in range(steps):
+        step()
+    synchronize(device)
+    return steps / (time.perf_counter() - start_time)
+
+
+@torch.no_grad()
+def predict(model, batch, precision, device):
+    with autocast(precision, device):
+        return model.eval()(**batch)["s1"].float()
+
+
+def main(config, args):
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    model = ConfigParser.init_obj(config["arch"], module_arch, speakers_cnt=args.speakers_cnt).to(device)
+    criterion = ConfigParser.init_obj(config["loss"], module_loss).to(device)
+    batch = get_batch(args.batch_size, args.seconds, config["preprocessing"]["sr"], args.speakers_cnt, device)
+
+    reference = predict(model, batch, "fp32", device)
+    print(f"device: {device}, batch size: {args.batch_size}, {args.seconds} s")
+    for precision in AUTOCAST_DTYPES:
+        if resolve_precision(precision, device) != precision:
+            continue
+        if precision == "bf16" and device.type == "cuda" and not torch.cuda.is_bf16_supported():
+            continue
+        steps_per_sec = run(model, criterion, batch, precision, args.steps, device)
+        # SI-SDR of the output against the fp32 output of the same weights, higher is closer
+        parity = si_sdr(predict(model, batch, precision, device), reference, batch["y_wav_len"]).mean().item()
+        print(f"{precision}: {steps_per_sec:.2f} steps/s, SI-SDR to fp32 output: {parity:.2f} dB")
+
+
+if __name__ == "__main__":
+    args = argparse.ArgumentParser(description="Mixed precision benchmark")
+    args.add_argument("-c", "--config", default="src/configs/kaggle.json", type=str, help="Path to config with arch and loss")
+    args.add_argument("--steps", default=20, type=int, help="Number of measured training steps")
+    args.add_argument("-b", "--batch_size", default=4, type=int, help="Batch size")
+    args.add_argument("-s", "--seconds", default=3.0, type=float, help="Length of mixtures and references in seconds")
+    args.add_argument("--speakers_cnt", default=251, type=int, help="Number of speakers of the classification head")
+    args = args.parse_args()
+
+    with Path(args.config).open() as f:
+        config = json.load(f)
+
+    main(config, args)
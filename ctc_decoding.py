@@ -0,0 +1,163 @@
+"""
+CTC decoding shared by the speech separation (src) and ASR (hw_asr) text encoders.
+It depends only on numpy and torch, so neither package imports the other.
+"""
+from typing import Dict, List, NamedTuple
+
+import numpy as np
+import torch
+
+
+class Hypothesis(NamedTuple):
+    text: str
+    prob: float
+
+
+def to_numpy(array) -> np.ndarray:
+    if isinstance(array, torch.Tensor):
+        return array.detach().cpu().numpy()
+    return np.asarray(array)
+
+
+def ctc_decode_batch(log_probs: torch.Tensor, ind2char: Dict[int, str], blank: int, lengths=None) -> List[str]:
+    """
+    Greedy decoding of B x T x V log-probabilities on their device. Repeats are collapsed and blanks are removed
+    by tensor ops over the B x T argmax matrix, only the kept indices are transferred to host.
+    :param lengths: numbers of frames of utterances, all frames are decoded by default.
+    """
+    inds = log_probs.argmax(-1)
+    frames = torch.arange(inds.shape[1], device=inds.device)
+    keep = inds != blank
+    keep[:, 1:] &= inds[:, 1:] != inds[:, :-1]
+    if lengths is not None:
+        keep &= frames < torch.as_tensor(lengths, device=inds.device).unsqueeze(1)
+    # numbers of kept indices followed by the indices themselves, in one transfer
+    host = torch.cat([keep.sum(1), inds[keep]]).tolist()
+    counts, kept = host[: inds.shape[0]], host[inds.shape[0] :]
+    texts, offset = [], 0
+    for count in counts:
+        texts.append("".join(ind2char[ind] for ind in kept[offset : offset + count]))
+        offset += count
+    return texts
+
+
+# prefixes are identified by polynomial hashes of their character indices, computed modulo 2^64
+HASH_BASE = np.uint64(1000003)
+
+
+def ctc_prefix_beam_search_batch(
+    log_probs, lengths, ind2char: Dict[int, str], blank: int, beam_size: int, top_k: int = None
+) -> List[List[Hypothesis]]:
+    """
+    CTC prefix beam search in log space over a batch of utterances. Every prefix keeps log-probabilities of paths
+    ending in blank and in its last character, so repeated characters are merged only when there is no blank between them.
+    Beams of all utterances are B x beam_size arrays and every frame is one set of array ops: extensions of all
+    prefixes by all characters are scored at once, and an extension equal to a kept prefix is found by comparing
+    prefix hashes. Frames beyond the length of an utterance leave its beam unchanged.
+
+    :param log_probs: B x T x V frame log-probabilities, they are moved to host at once.
+    :param lengths: numbers of frames of utterances, all frames are decoded by default.
+    :param top_k: only top_k most probable characters of every frame extend prefixes, all characters by default.
+    :return: hypotheses of every utterance sorted by log-probability, which is stored in the `prob` field.
+    """
+    log_probs = to_numpy(log_probs).astype(np.float32, copy=False)
+    assert len(log_probs.shape) == 3
+    batch_size, max_length, voc_size = log_probs.shape
+    assert voc_size == len(ind2char)
+    lengths = np.full(batch_size, max_length) if lengths is None else to_numpy(lengths).astype(np.int64)
+    chars = np.array([ind for ind in range(voc_size) if ind != blank])
+    cands_cnt = len(chars) if top_k is None else min(top_k, len(chars))
+    rows = np.arange(batch_size)[:, None]
+
+    # hashes of prefixes and of prefixes without their last characters, last characters (-1 for the empty prefix),
+    # log-probabilities of paths ending in blank and in the last character, the empty prefix starts every beam
+    hashes = np.zeros((batch_size, beam_size), dtype=np.uint64)
+    parent_hashes = np.zeros((batch_size, beam_size), dtype=np.uint64)
+    last = np.full((batch_size, beam_size), -1)
+    p_b = np.full((batch_size, beam_size), -np.inf, dtype=np.float32)
+    p_b[:, 0] = 0
+    p_nb = np.full((batch_size, beam_size), -np.inf, dtype=np.float32)
+    # beam slots of the previous frame and appended characters (-1 when the prefix stays) for backtracking
+    back_slots, back_chars = [], []
+    for t in range(max_length):
+        frame = log_probs[:, t]
+        if cands_cnt < len(chars):
+            cands = chars[np.argpartition(frame[:, chars], -cands_cnt, axis=1)[:, -cands_cnt:]]
+        else:
+            cands = np.broadcast_to(chars, (batch_size, cands_cnt))
+        cand_pos = np.full((batch_size, voc_size), -1)
+        cand_pos[rows, cands] = np.arange(cands_cnt)
+
+        total = np.logaddexp(p_b, p_nb)
+        # the prefix stays the same after a blank or a repeat of its last character
+        stay_b = total + frame[:, blank, None]
+        stay_nb = p_nb + np.where(last >= 0, np.take_along_axis(frame, np.maximum(last, 0), 1), -np.inf)
+        # a repeat of the last character extends the prefix only after a blank
+        ext = np.where(cands[:, None, :] == last[:, :, None], p_b[:, :, None], total[:, :, None]) + np.take_along_axis(frame, cands, 1)[:, None, :]
+
+        # an extension equal to another kept prefix is merged into it: the kept prefix is a child of the extended one
+        kept = np.isfinite(total) & (t < lengths)[:, None]
+        is_child = (parent_hashes[:, :, None] == hashes[:, None, :]) & (kept & (last >= 0))[:, :, None] & kept[:, None, :]
+        char_pos = np.take_along_axis(cand_pos, np.maximum(last, 0), 1)
+        b_ind, child_ind = np.nonzero(is_child.any(2) & (char_pos >= 0))
+        parent_ind, k_ind = is_child[b_ind, child_ind].argmax(1), char_pos[b_ind, child_ind]
+        stay_nb[b_ind, child_ind] = np.logaddexp(stay_nb[b_ind, child_ind], ext[b_ind, parent_ind, k_ind])
+        ext[b_ind, parent_ind, k_ind] = -np.inf
+
+        # first beam_size candidates keep their prefix, the others extend it
+        ext = ext.reshape(batch_size, -1)
+        scores = np.concatenate([np.logaddexp(stay_b, stay_nb), ext], axis=1)
+        best = np.argpartition(-scores, beam_size - 1, axis=1)[:, :beam_size]
+        is_stay = best < beam_size
+        ext_ind = np.maximum(best - beam_size, 0)
+        stay_ind = np.minimum(best, beam_size - 1)
+        slots = np.where(is_stay, best, ext_ind // cands_cnt)
+        new_chars = np.where(is_stay, -1, np.take_along_axis(cands, ext_ind % cands_cnt, 1))
+
+        # utterances which already ended keep their beams
+        active = (t < lengths)[:, None]
+        slots = np.where(active, slots, np.arange(beam_size))
+        new_chars = np.where(active, new_chars, -1)
+        is_stay = new_chars < 0
+        prev_hashes = np.take_along_axis(hashes, slots, 1)
+        parent_hashes = np.where(is_stay, np.take_along_axis(parent_hashes, slots, 1), prev_hashes)
+        hashes = np.where(is_stay, prev_hashes, prev_hashes * HASH_BASE + (new_chars + 1).astype(np.uint64))
+        last = np.where(is_stay, np.take_along_axis(last, slots, 1), new_chars)
+        p_b, p_nb = (
+            np.where(active, np.where(is_stay, np.take_along_axis(stay_b, stay_ind, 1), -np.inf), p_b).astype(np.float32),
+            np.where(active, np.where(is_stay, np.take_along_axis(stay_nb, stay_ind, 1), np.take_along_axis(ext, ext_ind, 1)), p_nb).astype(np.float32),
+        )
+        back_slots.append(slots)
+        back_chars.append(new_chars)
+
+    # characters of prefixes are collected from the last frame backwards, -1 maps to the empty string
+    symbols = np.array([ind2char[ind] for ind in range(voc_size)] + [""], dtype=object)
+    prefix_chars = []
+    slots = np.broadcast_to(np.arange(beam_size), (batch_size, beam_size))
+    for frame_slots, frame_chars in zip(reversed(back_slots), reversed(back_chars)):
+        prefix_chars.append(np.take_along_axis(frame_chars, slots, 1))
+        slots = np.take_along_axis(frame_slots, slots, 1)
+    prefix_chars = np.stack(prefix_chars[::-1], axis=-1) if prefix_chars else np.full((batch_size, beam_size, 0), -1)
+
+    scores = np.logaddexp(p_b, p_nb)
+    hypos = []
+    for utterance_chars, utterance_scores in zip(prefix_chars, scores):
+        order = [i for i in np.argsort(-utterance_scores) if np.isfinite(utterance_scores[i])]
+        hypos.append([Hypothesis("".join(symbols[utterance_chars[i]]), float(utterance_scores[i])) for i in order])
+    return hypos
+
+
+def ctc_prefix_beam_search(log_probs, ind2char: Dict[int, str], blank: int, beam_size: int, top_k: int = None) -> List[Hypothesis]:
+    """
+    CTC prefix beam search over T x V frame log-probabilities of one utterance, see ctc_prefix_beam_search_batch.
+    """
+    log_probs = to_numpy(log_probs)
+    assert len(log_probs.shape) == 2
+    return ctc_prefix_beam_search_batch(log_probs[None], None, ind2char, blank, beam_size, top_k)[0]
+
+
+def ctc_beam_search_batch(log_probs, lengths, ind2char: Dict[int, str], blank: int, beam_size: int, top_k: int = None) -> List[str]:
+    """
+    The most probable texts of B x T x V log-probabilities of utterances with the given lengths.
+    """
+    return [hypos[0].text for hypos in ctc_prefix_beam_search_batch(log_probs, lengths, ind2char, blank, beam_size, top_k)]
@@ -0,0 +1,76 @@
+import argparse
+import json
+from pathlib import Path
+
+import torch
+
+from src.inference import export_onnx, export_weights, load_ss_model
+from src.inference.onnx_backend import EXPORT_MODES
+from src.utils.parse_config import ConfigParser
+
+
+def main(config, args):
+    logger = config.get_logger("export")
+    model = load_ss_model(config, args.ss_checkpoint, torch.device("cpu"), ema=args.ema)
+    logger.info(model)
+    if args.format == "weights":
+        export_weights(model, config["ss_arch"], args.output, ema=args.ema)
+    else:
+        export_onnx(model, args.output, mode=args.mode, opset_version=args.opset, sr=config["preprocessing"]["sr"])
+    logger.info(f"Model has been exported to {args.output}.")
+
+
+if __name__ == "__main__":
+    args = argparse.ArgumentParser(description="PyTorch Template")
+    args.add_argument(
+        "-c",
+        "--config",
+        default="test_model/config.json",
+        type=str,
+        help="Path to config",
+    )
+    args.add_argument(
+        "--ss_checkpoint",
+        default="test_model/ss_checkpoint.pth",
+        type=str,
+        help="Path to speech separation checkpoint",
+    )
+    args.add_argument(
+        "-o",
+        "--output",
+        default="test_model/ss_model.onnx",
+        type=str,
+        help="Path to exported model (.onnx or .pth)",
+    )
+    args.add_argument(
+        "--ema",
+        action="store_true",
+        help="Export exponential moving average of weights from training checkpoint",
+    )
+    args.add_argument(
+        "-f",
+        "--format",
+        default="onnx",
+        choices=["onnx", "weights"],
+        help="onnx: ONNX model, weights: slim weights-only checkpoint for fast memory-mapped loading",
+    )
+    args.add_argument(
+        "-m",
+        "--mode",
+        default="reference",
+        choices=EXPORT_MODES,
+        help="reference: mixture and reference audio inputs, embedding: mixture and precomputed speaker embedding inputs, "
+        "speaker_encoder: reference audio to speaker embedding",
+    )
+    args.add_argument(
+        "--opset",
+        default=17,
+        type=int,
+        help="ONNX opset version",
+    )
+    args = args.parse_args()
+
+    with Path(args.config).open() as f:
+        config = ConfigParser(json.load(f))
+
+    main(config, args)
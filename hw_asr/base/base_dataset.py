@@ -31,6 +31,8 @@ class BaseDataset(Dataset):
         self.wave_augs = wave_augs
         self.spec_augs = spec_augs
         self.log_spec = config_parser["preprocessing"]["log_spec"]
+        # built on first use, so every dataloader worker constructs the transform once
+        self._wave2spec = None
 
         self._assert_index_is_valid(index)
         index = self._filter_records_from_dataset(index, max_audio_length, max_text_length, limit)
@@ -68,15 +70,20 @@ class BaseDataset(Dataset):
             audio_tensor = torchaudio.functional.resample(audio_tensor, sr, target_sr)
         return audio_tensor
 
+    @property
+    def wave2spec(self):
+        if self._wave2spec is None:
+            self._wave2spec = self.config_parser.init_obj(
+                self.config_parser["preprocessing"]["spectrogram"],
+                torchaudio.transforms,
+            )
+        return self._wave2spec
+
     def process_wave(self, audio_tensor_wave: Tensor):
         with torch.no_grad():
             if self.wave_augs is not None:
                 audio_tensor_wave = self.wave_augs(audio_tensor_wave)
-            wave2spec = self.config_parser.init_obj(
-                self.config_parser["preprocessing"]["spectrogram"],
-                torchaudio.transforms,
-            )
-            audio_tensor_spec = wave2spec(audio_tensor_wave)
+            audio_tensor_spec = self.wave2spec(audio_tensor_wave)
             if self.spec_augs is not None:
                 audio_tensor_spec = self.spec_augs(audio_tensor_spec)
             if self.log_spec:
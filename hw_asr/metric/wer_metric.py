@@ -1,6 +1,5 @@
 from typing import List
 
-import numpy as np
 import torch
 from torch import Tensor
 
@@ -16,14 +15,14 @@ class ArgmaxWERMetric(BaseMetric):
 
     def __call__(self, log_probs: Tensor, log_probs_length: Tensor, text: List[str], **kwargs):
         wers = []
-        predictions = torch.argmax(log_probs.cpu(), dim=-1).numpy()
-        lengths = log_probs_length.detach().numpy()
-        for log_prob_vec, length, target_text in zip(predictions, lengths, text):
+        if hasattr(self.text_encoder, "ctc_decode_batch"):
+            pred_texts = self.text_encoder.ctc_decode_batch(log_probs, log_probs_length)
+        else:
+            predictions = torch.argmax(log_probs.cpu(), dim=-1).numpy()
+            lengths = log_probs_length.detach().numpy()
+            pred_texts = [self.text_encoder.decode(inds[:length]) for inds, length in zip(predictions, lengths)]
+        for pred_text, target_text in zip(pred_texts, text):
             target_text = BaseTextEncoder.normalize_text(target_text)
-            if hasattr(self.text_encoder, "ctc_decode"):
-                pred_text = self.text_encoder.ctc_decode(log_prob_vec[:length])
-            else:
-                pred_text = self.text_encoder.decode(log_prob_vec[:length])
             wers.append(calc_wer(target_text, pred_text))
         return sum(wers) / len(wers)
     
@@ -36,14 +35,10 @@ class BeamSearchWERMetric(BaseMetric):
 
     def __call__(self, log_probs: Tensor, log_probs_length: Tensor, text: List[str], **kwargs):
         wers = []
-        probs = np.exp(log_probs.detach().cpu().numpy())
-        lengths = log_probs_length.detach().numpy()
-        for prob, length, target_text in zip(probs, lengths, text):
+        assert hasattr(self.text_encoder, "ctc_beam_search_batch")
+        pred_texts = self.text_encoder.ctc_beam_search_batch(log_probs, log_probs_length, self.beam_size)
+        for pred_text, target_text in zip(pred_texts, text):
             target_text = BaseTextEncoder.normalize_text(target_text)
-            if hasattr(self.text_encoder, "ctc_beam_search"):
-                pred_text = self.text_encoder.ctc_beam_search(prob[:length], self.beam_size)
-            else:
-                assert False
             wers.append(calc_wer(target_text, pred_text))
         return sum(wers) / len(wers)
     
@@ -53,15 +48,11 @@ class LanguageModelWERMetric(BaseMetric):
         super().__init__(*args, **kwargs)
         self.text_encoder = text_encoder
 
-    def __call__(self, logits: Tensor, log_probs_length: Tensor, text: List[str], **kwargs):
+    def __call__(self, log_probs: Tensor, log_probs_length: Tensor, text: List[str], **kwargs):
         wers = []
-        logits = logits.detach().cpu().numpy()
-        lengths = log_probs_length.detach().numpy()
-        for logit, length, target_text in zip(logits, lengths, text):
+        assert hasattr(self.text_encoder, "ctc_lm_beam_search_batch")
+        pred_texts = self.text_encoder.ctc_lm_beam_search_batch(log_probs, log_probs_length)
+        for pred_text, target_text in zip(pred_texts, text):
             target_text = BaseTextEncoder.normalize_text(target_text)
-            if hasattr(self.text_encoder, "ctc_lm_beam_search"):
-                pred_text = self.text_encoder.ctc_lm_beam_search(logit[:length])
-            else:
-                assert False
             wers.append(calc_wer(target_text, pred_text))
         return sum(wers) / len(wers)
@@ -1,6 +1,9 @@
+import tempfile
 import unittest
+from pathlib import Path
 
 from hw_asr.text_encoder.ctc_char_text_encoder import CTCCharTextEncoder
+from hw_asr.text_encoder.lm_decoder import lower_arpa
 
 
 class TestTextEncoder(unittest.TestCase):
@@ -20,3 +23,12 @@ class TestTextEncoder(unittest.TestCase):
     #     len(text_encoder.ind2char)
     #     probs
     #     text_encoder.ctc_beam_search()
+
+    def test_lower_arpa(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            model_path = Path(tmp_dir) / "3-gram.arpa"
+            model_path.write_text("\\data\\\nngram 1=2\n\n\\1-grams:\n-1.0\tHELLO\n-1.0\tWORLD\n")
+            lower_path = lower_arpa(str(model_path))
+            self.assertEqual(Path(lower_path).name, "lower_3-gram.arpa")
+            self.assertEqual(Path(lower_path).read_text(), model_path.read_text().lower())
+            self.assertEqual(lower_arpa(lower_path), lower_path)
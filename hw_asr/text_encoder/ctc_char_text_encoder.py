@@ -1,31 +1,28 @@
-from typing import List, NamedTuple
+from typing import List
 
+import numpy as np
 import torch
-from pyctcdecode import build_ctcdecoder
-
 
+from ctc_decoding import Hypothesis, ctc_beam_search_batch, ctc_decode_batch, ctc_prefix_beam_search, to_numpy
 from hw_asr.base.base_text_encoder import BaseTextEncoder
 from .char_text_encoder import CharTextEncoder
-from collections import defaultdict
-
-
-class Hypothesis(NamedTuple):
-    text: str
-    prob: float
+from .lm_decoder import LMDecoder
 
 
 class CTCCharTextEncoder(CharTextEncoder):
     EMPTY_TOK = "^"
 
-    def __init__(self, alphabet: List[str] = None, kenlm_model_path: str = None, unigrams_path: str = None):
+    def __init__(self, alphabet: List[str] = None, kenlm_model_path: str = None, unigrams_path: str = None, lm_decoder: dict = None):
+        """
+        :param lm_decoder: arguments of LMDecoder, e.g. {"beam_width": 500, "beam_prune_logp": -10.0, "num_workers": 4}.
+        """
         super().__init__(alphabet)
         vocab = [self.EMPTY_TOK] + list(self.alphabet)
         self.ind2char = dict(enumerate(vocab))
         self.char2ind = {v: k for k, v in self.ind2char.items()}
+        self.lm_decoder = None
         if kenlm_model_path is not None:
-            with open(unigrams_path) as f:
-                unigrams = [line.strip() for line in f.readlines()]
-            self.decoder = build_ctcdecoder(labels=[""] + self.alphabet, kenlm_model_path=kenlm_model_path, unigrams=unigrams)
+            self.lm_decoder = LMDecoder([""] + list(self.alphabet), kenlm_model_path, unigrams_path, **(lm_decoder or {}))
 
     def ctc_decode(self, inds: List[int]) -> str:
         # TODO: your code here
@@ -38,49 +35,33 @@ class CTCCharTextEncoder(CharTextEncoder):
             last_char = cur_char
         return ''.join(result)
 
-    def ctc_beam_search(self, probs: torch.tensor, beam_size: int) -> str:
+    def ctc_decode_batch(self, log_probs: torch.Tensor, lengths=None) -> List[str]:
         """
-            Performs beam search and returns a list of pairs (hypothesis, hypothesis probability).
+        Greedy decoding of B x T x V log-probabilities on their device, see ctc_decoding.ctc_decode_batch.
         """
-        assert len(probs.shape) == 2
-        char_length, voc_size = probs.shape
-        assert voc_size == len(self.ind2char)
-        hypos: List[Hypothesis] = []
-        # TODO: your code here
+        return ctc_decode_batch(log_probs, self.ind2char, self.char2ind[self.EMPTY_TOK], lengths)
 
-        def extend_and_merge(frame, state):
-            new_state = defaultdict(float)
-            for next_char_index, next_char_proba in enumerate(frame):
-                for (pref, last_char), pref_proba in state.items():
-                    next_char = self.ind2char[next_char_index]
-                    if next_char == last_char:
-                        new_pref = pref
-                    else:
-                        if next_char != self.EMPTY_TOK:
-                            new_pref = pref + next_char
-                        else:
-                            new_pref = pref
-                        last_char = next_char
-                    new_state[(new_pref, last_char)] += pref_proba * next_char_proba
-            return new_state
+    def ctc_beam_search(self, probs: torch.tensor, beam_size: int, top_k: int = None) -> str:
+        """
+        Performs CTC prefix beam search over T x V frame probabilities and returns the most probable text.
+        """
+        with np.errstate(divide="ignore"):
+            log_probs = np.log(to_numpy(probs))
+        return self.ctc_prefix_beam_search(log_probs, beam_size, top_k)[0].text
+
+    def ctc_beam_search_batch(self, log_probs, lengths, beam_size: int, top_k: int = None) -> List[str]:
+        return ctc_beam_search_batch(log_probs, lengths, self.ind2char, self.char2ind[self.EMPTY_TOK], beam_size, top_k)
 
-        def truncate(state, beam_size):
-            state_list = list(state.items())
-            state_list.sort(key=lambda x: -x[1])
-            return dict(state_list[:beam_size])
+    def ctc_prefix_beam_search(self, log_probs, beam_size: int, top_k: int = None) -> List[Hypothesis]:
+        return ctc_prefix_beam_search(log_probs, self.ind2char, self.char2ind[self.EMPTY_TOK], beam_size, top_k)
 
-        state = {('', self.EMPTY_TOK): 1.0}
-        for frame in probs:
-            state = extend_and_merge(frame, state)
-            state = truncate(state, beam_size)
-        state_list = list(state.items())
-        state_list.sort(key=lambda x: -x[1])
-        
-        # for state in state_list:
-        #     hypos.append(Hypothesis(state[0][0], state[1]))
-        
-        return state_list[0][0][0]
-    
-    def ctc_lm_beam_search(self, logits: torch.tensor) -> str:
-        assert self.decoder is not None
-        return self.decoder.decode(logits, beam_width=500).lower()
\ No newline at end of file
+    def ctc_lm_beam_search(self, log_probs: torch.tensor) -> str:
+        assert self.lm_decoder is not None
+        return self.lm_decoder.decode(log_probs)
+
+    def ctc_lm_beam_search_batch(self, log_probs, lengths) -> List[str]:
+        """
+        Decodes B x T x V log-probabilities of utterances with the given lengths by the decoding pool.
+        """
+        assert self.lm_decoder is not None
+        return self.lm_decoder.decode_batch(log_probs, lengths)
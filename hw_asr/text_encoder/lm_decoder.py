@@ -0,0 +1,133 @@
+import logging
+import multiprocessing as mp
+import time
+from pathlib import Path
+from typing import List
+
+import numpy as np
+import torch
+
+logger = logging.getLogger(__name__)
+
+
+def lower_arpa(kenlm_model_path: str) -> str:
+    """
+    LibriSpeech language models are upper case, while texts are normalized to lower case.
+    Writes a lower case copy `lower_<name>` of an ARPA model next to it once and returns its path.
+    Binary models and already lowered ones are returned as is.
+    """
+    path = Path(kenlm_model_path)
+    if path.suffix != ".arpa" or path.name.startswith("lower_"):
+        return kenlm_model_path
+    lower_path = path.parent / f"lower_{path.name}"
+    if lower_path.exists() and lower_path.stat().st_mtime >= path.stat().st_mtime:
+        return str(lower_path)
+
+    logger.info(f"Writing lower case language model {lower_path}...")
+    tmp_path = lower_path.with_name(lower_path.name + ".tmp")
+    with path.open() as fin, tmp_path.open("w") as fout:
+        for line in fin:
+            fout.write(line.lower())
+    tmp_path.replace(lower_path)
+    return str(lower_path)
+
+
+class LMDecoder:
+    """
+    CTC beam search with a KenLM language model. The pyctcdecode decoder is built once, batches are decoded
+    by its decode_batch on a persistent pool of workers forked right after it. Forking a process with cuda
+    or running threads may deadlock, so the decoder must be built before the model is moved to gpu and
+    dataloader or logging threads are started, and closed when decoding is finished.
+    Decoded utterances and frames per second of decoding time are accumulated for reporting.
+    """
+
+    def __init__(
+        self,
+        labels: List[str],
+        kenlm_model_path: str,
+        unigrams_path: str = None,
+        beam_width: int = 500,
+        beam_prune_logp: float = -10.0,
+        token_min_logp: float = -5.0,
+        num_workers: int = 0,
+    ):
+        """
+        :param beam_width: number of kept hypotheses.
+        :param beam_prune_logp: hypotheses less probable than the best one by this log-probability are pruned.
+        :param token_min_logp: tokens of a frame less probable than this log-probability are skipped,
+                               the most probable one is always kept.
+        :param num_workers: size of the decoding pool, batches are decoded in the calling process with 0 workers.
+        """
+        from pyctcdecode import build_ctcdecoder
+
+        unigrams = None
+        if unigrams_path is not None:
+            with open(unigrams_path) as f:
+                unigrams = [line.strip() for line in f.readlines()]
+        self.decoder = build_ctcdecoder(labels=labels, kenlm_model_path=lower_arpa(kenlm_model_path), unigrams=unigrams)
+        self.beam_width = beam_width
+        self.beam_prune_logp = beam_prune_logp
+        self.token_min_logp = token_min_logp
+        self.num_workers = num_workers
+        self._pool = None
+        if num_workers > 0:
+            # pyctcdecode shares the language model with workers forked after the decoder is built
+            self._pool = mp.get_context("fork").Pool(num_workers)
+        self.reset_stats()
+
+    def _decode_args(self):
+        return {"beam_width": self.beam_width, "beam_prune_logp": self.beam_prune_logp, "token_min_logp": self.token_min_logp}
+
+    def decode(self, log_probs) -> str:
+        """
+        :param log_probs: T x V frame log-probabilities.
+        """
+        return self.decode_batch([log_probs])[0]
+
+    def decode_batch(self, log_probs, lengths=None) -> List[str]:
+        """
+        :param log_probs: B x T x V frame log-probabilities or a list of T x V ones.
+        :param lengths: numbers of frames of utterances, all frames are decoded by default.
+        """
+        if isinstance(log_probs, torch.Tensor):
+            log_probs = log_probs.detach().cpu().numpy()
+        if lengths is None:
+            lengths = [len(utterance) for utterance in log_probs]
+        elif isinstance(lengths, torch.Tensor):
+            lengths = lengths.detach().cpu().numpy()
+        log_probs = [np.asarray(utterance[: int(length)], dtype=np.float32) for utterance, length in zip(log_probs, lengths)]
+
+        start_time = time.perf_counter()
+        if self._pool is not None and len(log_probs) > 1:
+            texts = self.decoder.decode_batch(self._pool, log_probs, **self._decode_args())
+        else:
+            texts = [self.decoder.decode(utterance, **self._decode_args()) for utterance in log_probs]
+        self.decode_time += time.perf_counter() - start_time
+        self.decoded_cnt += len(log_probs)
+        self.decoded_frames += sum(len(utterance) for utterance in log_probs)
+        return [text.lower() for text in texts]
+
+    def reset_stats(self):
+        self.decode_time = 0.0
+        self.decoded_cnt = 0
+        self.decoded_frames = 0
+
+    def throughput(self):
+        """
+        :return: decoded utterances and frames per second since the last reset.
+        """
+        if self.decode_time == 0:
+            return {"utterances per sec": 0.0, "frames per sec": 0.0}
+        return {"utterances per sec": self.decoded_cnt / self.decode_time, "frames per sec": self.decoded_frames / self.decode_time}
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def __getstate__(self):
+        # the pool stays in the process which started it, copies decode in the calling process
+        state = self.__dict__.copy()
+        state["_pool"] = None
+        return state
@@ -60,6 +60,15 @@ class Trainer(BaseTrainer):
             "loss", *[m.name for m in self.metrics], writer=self.writer
         )
 
+    def train(self):
+        try:
+            super().train()
+        finally:
+            # the language model decoding pool
+            lm_decoder = getattr(self.text_encoder, "lm_decoder", None)
+            if lm_decoder is not None:
+                lm_decoder.close()
+
     @staticmethod
     def move_batch_to_device(batch, device: torch.device):
         """
@@ -190,6 +199,7 @@ class Trainer(BaseTrainer):
             self._log_predictions(**batch)
             self._log_spectrogram(batch["spectrogram"])
             self._log_scalars(self.evaluation_metrics)
+            self._log_lm_throughput()
 
         # add histogram of model parameters to the tensorboard
         # for name, p in self.model.named_parameters():
@@ -236,14 +246,12 @@ class Trainer(BaseTrainer):
             for inds, ind_len in zip(argmax_inds, log_probs_length.numpy())
         ]
         argmax_texts_raw = [self.text_encoder.decode(inds) for inds in argmax_inds]
-        argmax_texts = [self.text_encoder.ctc_decode(inds) for inds in argmax_inds]
+        argmax_texts = self.text_encoder.ctc_decode_batch(log_probs, log_probs_length)
         
-        probs = np.exp(log_probs.detach().cpu().numpy())
         probs_length = log_probs_length.detach().cpu().numpy()
-        bs_preds = [self.text_encoder.ctc_beam_search(prob[:prob_length], 4) for prob, prob_length in zip(probs, probs_length)]
+        bs_preds = self.text_encoder.ctc_beam_search_batch(log_probs, probs_length, 4)
         
-        logits = logits.detach().cpu().numpy()
-        lm_preds = [self.text_encoder.ctc_lm_beam_search(logit[:length]) for logit, length in zip(logits, probs_length)]
+        lm_preds = self.text_encoder.ctc_lm_beam_search_batch(log_probs, probs_length)
         
         tuples = list(zip(argmax_texts, bs_preds, lm_preds, text, argmax_texts_raw, audio_path, audio))
         rows = {}
@@ -299,3 +307,11 @@ class Trainer(BaseTrainer):
             return
         for metric_name in metric_tracker.keys():
             self.writer.add_scalar(f"{metric_name}", metric_tracker.avg(metric_name))
+
+    def _log_lm_throughput(self):
+        lm_decoder = getattr(self.text_encoder, "lm_decoder", None)
+        if self.writer is None or lm_decoder is None or lm_decoder.decoded_cnt == 0:
+            return
+        for name, value in lm_decoder.throughput().items():
+            self.writer.add_scalar(f"LM decoding {name}", value)
+        lm_decoder.reset_stats()
@@ -0,0 +1,88 @@
+import argparse
+import json
+import logging
+import multiprocessing as mp
+from pathlib import Path
+
+import torch
+
+import src.datasets
+from src.inference.server import ServerState, make_http_server, worker_main
+from src.inference.utils import build_speaker_bank, load_ss_model
+from src.utils.parse_config import ConfigParser
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("serve")
+
+
+def enroll(config, args):
+    model = load_ss_model(config, args.ss_checkpoint, torch.device("cpu"))
+    dataset = ConfigParser.init_obj(config["data"]["test"]["datasets"][0], src.datasets, config_parser=config)
+    speaker_bank = build_speaker_bank(model, dataset, torch.device("cpu"))
+    torch.save(speaker_bank, args.speaker_bank)
+    logger.info(f"{len(speaker_bank)} speakers have been enrolled to {args.speaker_bank}.")
+
+
+def main(config, args):
+    ctx = mp.get_context("spawn")
+    request_queue, result_queue = ctx.Queue(), ctx.Queue()
+    worker_args = {
+        "threads": args.threads,
+        "pin_cores": args.pin_cores,
+        "max_batch_size": args.max_batch_size,
+        "max_wait_ms": args.max_wait_ms,
+        "length_tolerance": args.length_tolerance,
+    }
+    workers = [
+        ctx.Process(
+            target=worker_main,
+            args=(i, config, args.ss_checkpoint, args.speaker_bank, request_queue, result_queue, worker_args),
+            daemon=True,
+        )
+        for i in range(args.workers)
+    ]
+    for worker in workers:
+        worker.start()
+
+    state = ServerState(request_queue, result_queue, args.timeout)
+    server = make_http_server(state, args.host, args.port, args.unix_socket)
+    logger.info(f"Serving on {args.unix_socket or f'{args.host}:{args.port}'} with {args.workers} workers.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Shutting down...")
+    finally:
+        server.server_close()
+        for _ in workers:
+            request_queue.put(None)
+        for worker in workers:
+            worker.join()
+        result_queue.put(None)
+
+
+if __name__ == "__main__":
+    args = argparse.ArgumentParser(description="SpEx+ cpu serving")
+    args.add_argument("-c", "--config", default="test_model/config.json", type=str, help="Path to config")
+    args.add_argument("--ss_checkpoint", default="test_model/ss_checkpoint.pth", type=str, help="Path to speech separation checkpoint")
+    args.add_argument("--speaker_bank", default=None, type=str, help="Path to enrolled speaker embeddings for speaker_id requests")
+    args.add_argument("--enroll", action="store_true", help="Enroll speakers of the test split to --speaker_bank and exit")
+    args.add_argument("--host", default="127.0.0.1", type=str, help="Host to listen on")
+    args.add_argument("-p", "--port", default=8000, type=int, help="Port to listen on")
+    args.add_argument("--unix_socket", default=None, type=str, help="Listen on unix socket instead of tcp")
+    args.add_argument("-w", "--workers", default=2, type=int, help="Number of model worker processes")
+    args.add_argument("-t", "--threads", default=1, type=int, help="Number of intra-op threads per worker")
+    args.add_argument("--pin_cores", action="store_true", help="Pin every worker to its own set of cpu cores")
+    args.add_argument("--max_batch_size", default=8, type=int, help="Maximum dynamic batch size")
+    args.add_argument("--max_wait_ms", default=10.0, type=float, help="Maximum time to wait for a dynamic batch to fill")
+    args.add_argument("--length_tolerance", default=1.25, type=float, help="Maximum ratio of mixture lengths within a batch")
+    args.add_argument("--timeout", default=60.0, type=float, help="Request timeout in seconds")
+    args = args.parse_args()
+
+    with Path(args.config).open() as f:
+        config = json.load(f)
+
+    if args.enroll:
+        assert args.speaker_bank is not None, "Specify --speaker_bank path to save enrolled speakers"
+        enroll(config, args)
+    else:
+        main(config, args)
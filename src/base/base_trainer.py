@@ -2,9 +2,12 @@ from abc import abstractmethod
 
 import torch
 from numpy import inf
+from torch.distributed.optim import ZeroRedundancyOptimizer
 
 from src.base import BaseModel
 from src.logger import get_visualizer
+from src.utils.checkpoint import AsyncCheckpointWriter, get_rng_state, set_rng_state
+from src.utils.distributed import broadcast_object, is_main_process, unwrap_model
 
 
 class BaseTrainer:
@@ -26,6 +29,7 @@ class BaseTrainer:
 
         # for interrupt saving
         self._last_epoch = 0
+        self._last_step = None
 
         cfg_trainer = config["trainer"]
         self.epochs = cfg_trainer["epochs"]
@@ -46,14 +50,16 @@ class BaseTrainer:
                 self.early_stop = inf
 
         self.start_epoch = 1
+        # number of already trained batches of start_epoch when resuming from a step checkpoint
+        self.start_step = 0
+        self.save_step_period = cfg_trainer.get("save_step_period")
 
         self.checkpoint_dir = config.save_dir
+        # checkpoints are written in background, training continues after a cpu snapshot
+        self.checkpoint_writer = AsyncCheckpointWriter(self.checkpoint_dir, cfg_trainer.get("keep_last_checkpoints")) if is_main_process() else None
 
-        # setup visualization writer instance
-        self.writer = get_visualizer(config, self.logger, cfg_trainer["visualize"])
-
-        if config.resume is not None:
-            self._resume_checkpoint(config.resume)
+        # setup visualization writer instance, only the main process logs in distributed training
+        self.writer = get_visualizer(config, self.logger, cfg_trainer["visualize"]) if is_main_process() else None
 
     @abstractmethod
     def _train_epoch(self, epoch):
@@ -64,30 +70,47 @@ class BaseTrainer:
         """
         raise NotImplementedError()
 
-    def _save_checkpoint(self, epoch, save_best=False, only_best=False):
+    def _train_state(self):
+        """
+        Additional trainer state saved in checkpoints, e.g. gradient scaler and data position
+        """
+        return {}
+
+    def _load_train_state(self, checkpoint):
+        pass
+
+    def _save_checkpoint(self, epoch, save_best=False, step=None):
         """
         Saving checkpoints
 
         :param epoch: current epoch number
-        :param save_best: if True, rename the saved checkpoint to 'model_best.pth'
+        :param save_best: if True, link the saved checkpoint as 'model_best.pth'
+        :param step: number of trained batches of the unfinished epoch for step checkpoints
         """
-        arch = type(self.model).__name__
+        if isinstance(self.optimizer, ZeroRedundancyOptimizer):
+            # collective call, shards are gathered on the main process
+            self.optimizer.consolidate_state_dict(to=0)
+        if not is_main_process():
+            return
+        model = unwrap_model(self.model)
+        arch = type(model).__name__
         state = {
             "arch": arch,
             "epoch": epoch,
-            "state_dict": self.model.state_dict(),
+            "step": step,
+            "state_dict": model.state_dict(),
             "optimizer": self.optimizer.state_dict(),
+            "lr_scheduler": self.lr_scheduler.state_dict() if self.lr_scheduler is not None else None,
             "monitor_best": self.mnt_best,
-            "config": self.config,
+            "config": self.config.config,
+            "rng": get_rng_state(),
+            **self._train_state(),
         }
-        filename = str(self.checkpoint_dir / "checkpoint-epoch{}.pth".format(epoch))
-        if not (only_best and save_best):
-            torch.save(state, filename)
-            self.logger.info("Saving checkpoint: {} ...".format(filename))
-        if save_best:
-            best_path = str(self.checkpoint_dir / "model_best.pth")
-            torch.save(state, best_path)
-            self.logger.info("Saving current best: model_best.pth ...")
+        if step is not None:
+            filename = "checkpoint-epoch{}-step{}.pth".format(epoch, step)
+        else:
+            filename = "checkpoint-epoch{}.pth".format(epoch)
+        self.checkpoint_writer.save(state, filename, save_best=save_best)
 
     def _resume_checkpoint(self, resume_path):
         """
@@ -98,7 +121,12 @@ class BaseTrainer:
         resume_path = str(resume_path)
         self.logger.info("Loading checkpoint: {} ...".format(resume_path))
         checkpoint = torch.load(resume_path, self.device)
-        self.start_epoch = checkpoint["epoch"] + 1
+        if checkpoint.get("step") is not None:
+            # step checkpoint, the epoch is continued
+            self.start_epoch = checkpoint["epoch"]
+            self.start_step = checkpoint["step"]
+        else:
+            self.start_epoch = checkpoint["epoch"] + 1
         self.mnt_best = checkpoint["monitor_best"]
 
         # load architecture params from checkpoint.
@@ -107,19 +135,30 @@ class BaseTrainer:
                 "Warning: Architecture configuration given in config file is different from that "
                 "of checkpoint. This may yield an exception while state_dict is being loaded."
             )
-        self.model.load_state_dict(checkpoint["state_dict"])
+        unwrap_model(self.model).load_state_dict(checkpoint["state_dict"])
 
         if self.use_previous_optimizer:
             self.logger.info("Optimizer and lr_scheduler are loading...")
             # load optimizer state from checkpoint only when optimizer type is not changed.
-            if checkpoint["config"]["optimizer"] != self.config["optimizer"] or checkpoint["config"]["lr_scheduler"] != self.config["lr_scheduler"]:
+            # consolidated sharded state has the same format, so "zero" may be switched between runs
+            checkpoint_optimizer = {k: v for k, v in checkpoint["config"]["optimizer"].items() if k != "zero"}
+            optimizer = {k: v for k, v in self.config["optimizer"].items() if k != "zero"}
+            if checkpoint_optimizer != optimizer or checkpoint["config"]["lr_scheduler"] != self.config["lr_scheduler"]:
                 self.logger.warning(
                     "Warning: Optimizer or lr_scheduler given in config file is different " "from that of checkpoint. Optimizer parameters not being resumed."
                 )
             else:
+                # ZeroRedundancyOptimizer takes the shard of this process from the full state
                 self.optimizer.load_state_dict(checkpoint["optimizer"])
-                self.lr_scheduler.load_state_dict(checkpoint["lr_scheduler"])
-                self.logger.info("Optimizer and lr_scheduler have succesfully loaded.")
+                if checkpoint.get("lr_scheduler") is not None:
+                    self.lr_scheduler.load_state_dict(checkpoint["lr_scheduler"])
+                    self.logger.info("Optimizer and lr_scheduler have succesfully loaded.")
+                else:
+                    self.logger.warning("Warning: Checkpoint has no lr_scheduler state, only optimizer has been loaded.")
+
+        self._load_train_state(checkpoint)
+        if "rng" in checkpoint:
+            set_rng_state(checkpoint["rng"])
 
     def _train_process(self):
         """
@@ -133,6 +172,8 @@ class BaseTrainer:
             # save logged informations into log dict
             log = {"epoch": epoch}
             log.update(result)
+            # train metrics differ between processes, all of them follow the main process decisions
+            log = broadcast_object(log)
 
             # print logged informations to the screen
             for key, value in log.items():
@@ -168,14 +209,20 @@ class BaseTrainer:
                     break
 
             if epoch % self.save_period == 0 or best:
-                self._save_checkpoint(epoch, save_best=best, only_best=True)
+                self._save_checkpoint(epoch, save_best=best)
 
         self.logger.info("Checkpoint loaded. Resume training from epoch {}".format(self.start_epoch))
 
     def train(self):
+        # resumed after subclasses are initialized, since they restore their own state
+        if self.config.resume is not None:
+            self._resume_checkpoint(self.config.resume)
         try:
             self._train_process()
         except KeyboardInterrupt as e:
             self.logger.info("Saving model on keyboard interrupt")
-            self._save_checkpoint(self._last_epoch, save_best=False)
+            self._save_checkpoint(self._last_epoch, save_best=False, step=self._last_step)
             raise e
+        finally:
+            if self.checkpoint_writer is not None:
+                self.checkpoint_writer.close()
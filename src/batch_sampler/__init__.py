@@ -1,3 +1,4 @@
 from src.batch_sampler.group_sort_batch_sampler import GroupLengthBatchSampler
+from src.batch_sampler.resumable_sampler import ResumableSampler
 
-__all__ = ["GroupLengthBatchSampler"]
+__all__ = ["GroupLengthBatchSampler", "ResumableSampler"]
@@ -0,0 +1,53 @@
+import math
+
+import torch
+from torch.utils.data import Sampler
+
+from src.utils.distributed import get_rank, get_world_size
+
+
+class ResumableSampler(Sampler):
+    """
+    Sampler which can continue a pass over the dataset from the middle. Pass `p` is a permutation
+    seeded with `seed + p`, so it is reproduced from (pass_idx, start_offset) saved in a checkpoint.
+    In distributed training every process takes its own strided shard, like DistributedSampler.
+    """
+
+    def __init__(self, data_source, shuffle=True, seed=0, drop_last=False, num_replicas=None, rank=None):
+        self.data_source = data_source
+        self.shuffle = shuffle
+        self.seed = seed
+        self.drop_last = drop_last
+        self.num_replicas = num_replicas if num_replicas is not None else get_world_size()
+        self.rank = rank if rank is not None else get_rank()
+        if drop_last:
+            self.num_samples = len(data_source) // self.num_replicas
+        else:
+            self.num_samples = math.ceil(len(data_source) / self.num_replicas)
+        self.total_size = self.num_samples * self.num_replicas
+        # pass produced by the next __iter__ call and the number of its samples to skip
+        self.pass_idx = 0
+        self.start_offset = 0
+
+    def indices(self, pass_idx):
+        if self.shuffle:
+            generator = torch.Generator()
+            generator.manual_seed(self.seed + pass_idx)
+            indices = torch.randperm(len(self.data_source), generator=generator).tolist()
+        else:
+            indices = list(range(len(self.data_source)))
+        if self.drop_last:
+            indices = indices[: self.total_size]
+        else:
+            # pad with the first samples, so every process gets the same number of them
+            indices += (indices * math.ceil(self.total_size / len(indices)))[: self.total_size - len(indices)]
+        return indices[self.rank : self.total_size : self.num_replicas]
+
+    def __iter__(self):
+        indices = self.indices(self.pass_idx)[self.start_offset :]
+        self.pass_idx += 1
+        self.start_offset = 0
+        return iter(indices)
+
+    def __len__(self):
+        return self.num_samples
@@ -7,7 +7,7 @@ def ss_collate_fn(dataset_items: List[dict]):
     """
     Collate and pad fields in dataset items
     """
-    y_wav, x_wav, x_wav_len, target_wav, speaker_id, text = [], [], [], [], [], []
+    y_wav, y_wav_len, x_wav, x_wav_len, target_wav, speaker_id, text = [], [], [], [], [], [], []
 
     def get_max_length(key_):
         return max(dataset_items, key=lambda item: item[key_].shape[1])[key_].shape[1]
@@ -21,12 +21,15 @@ def ss_collate_fn(dataset_items: List[dict]):
         y_wav.append(pad_to_len(item["y_wav"], max_y_target_wav_length))
         x_wav.append(pad_to_len(item["x_wav"], max_x_wav_length))
         target_wav.append(pad_to_len(item["target_wav"], max_y_target_wav_length))
-        x_wav_len.append(item["x_wav"].shape[1])
+        # pad_to_len also prepends one zero sample to every item, it is a valid sample of both mixtures and references
+        y_wav_len.append(item["y_wav"].shape[1] + 1)
+        x_wav_len.append(item["x_wav"].shape[1] + 1)
         speaker_id.append(item["speaker_id"])
         text.append(item["text"] if "text" in item.keys() else "")
 
     return {
         "y_wav": torch.cat(y_wav),
+        "y_wav_len": torch.LongTensor(y_wav_len),
         "x_wav": torch.cat(x_wav),
         "x_wav_len": torch.Tensor(x_wav_len),
         "target_wav": torch.cat(target_wav),
@@ -19,7 +19,8 @@ class CustomDirAudioDataset(CustomAudioDataset):
 
         keys_intersection = mixes.keys() & refs.keys() & targets.keys()
         index = []
-        for id in keys_intersection:
+        # sorted, so every distributed process shards the same order
+        for id in sorted(keys_intersection):
             index += [mixes[id], refs[id], targets[id]]
         super().__init__(index, *args, **kwargs)
 
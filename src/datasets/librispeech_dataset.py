@@ -5,7 +5,6 @@ import shutil
 from pathlib import Path
 
 import torchaudio
-from speechbrain.utils.data_utils import download_file
 from tqdm import tqdm
 
 from src.base.base_dataset_w_text import BaseDatasetWText
@@ -43,6 +42,8 @@ class LibrispeechDataset(BaseDatasetWText):
         super().__init__(index, *args, **kwargs)
 
     def _load_part(self, part):
+        from speechbrain.utils.data_utils import download_file
+
         arch_path = self._data_dir / f"{part}.tar.gz"
         print(f"Loading part {part}")
         download_file(URL_LINKS[part], arch_path)
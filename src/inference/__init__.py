@@ -0,0 +1,5 @@
+from src.inference.onnx_backend import OnnxSpExPlus, export_onnx
+from src.inference.quantization import quantize_model
+from src.inference.utils import export_weights, load_ss_model
+
+__all__ = ["OnnxSpExPlus", "export_onnx", "quantize_model", "export_weights", "load_ss_model"]
@@ -0,0 +1,126 @@
+import logging
+from typing import Optional
+
+import torch
+from torch import nn
+
+from src.model.spex_plus_model import SpExPlusModel
+
+logger = logging.getLogger(__name__)
+
+EXPORT_MODES = ["reference", "embedding", "speaker_encoder"]
+
+
+class _ReferenceGraph(nn.Module):
+    def __init__(self, model: SpExPlusModel):
+        super().__init__()
+        self.model = model
+
+    def forward(self, y_wav, x_wav, x_wav_len):
+        speaker_pred, speaker_embedding = self.model.get_speaker_embedding(x_wav, x_wav_len)
+        s1, _, _ = self.model.extract(y_wav, speaker_embedding)
+        return s1, speaker_pred
+
+
+class _EmbeddingGraph(nn.Module):
+    def __init__(self, model: SpExPlusModel):
+        super().__init__()
+        self.model = model
+
+    def forward(self, y_wav, speaker_embedding):
+        s1, _, _ = self.model.extract(y_wav, speaker_embedding)
+        return s1
+
+
+class _SpeakerEncoderGraph(nn.Module):
+    def __init__(self, model: SpExPlusModel):
+        super().__init__()
+        self.model = model
+
+    def forward(self, x_wav, x_wav_len):
+        speaker_pred, speaker_embedding = self.model.get_speaker_embedding(x_wav, x_wav_len)
+        return speaker_embedding, speaker_pred
+
+
+@torch.no_grad()
+def export_onnx(model: SpExPlusModel, path: str, mode: str = "reference", opset_version: int = 17, sr: int = 16000):
+    """
+    Exports SpEx+ to ONNX with dynamic batch and audio length axes.
+
+    :param mode: "reference" - (y_wav, x_wav, x_wav_len) -> (s1, speaker_pred),
+                 "embedding" - (y_wav, speaker_embedding) -> s1, for precomputed speaker embeddings,
+                 "speaker_encoder" - (x_wav, x_wav_len) -> (speaker_embedding, speaker_pred).
+    """
+    assert mode in EXPORT_MODES, f"Unknown export mode {mode}, choose one of {EXPORT_MODES}"
+    if isinstance(model, nn.DataParallel):
+        model = model.module
+    model = model.cpu().eval()
+
+    y_wav = torch.randn(1, 2 * sr)
+    x_wav = torch.randn(1, 3 * sr)
+    x_wav_len = torch.Tensor([x_wav.shape[1]])
+    if mode == "reference":
+        graph = _ReferenceGraph(model)
+        args = (y_wav, x_wav, x_wav_len)
+        input_names, output_names = ["y_wav", "x_wav", "x_wav_len"], ["s1", "speaker_pred"]
+    elif mode == "embedding":
+        graph = _EmbeddingGraph(model)
+        args = (y_wav, model.get_speaker_embedding(x_wav, x_wav_len)[1])
+        input_names, output_names = ["y_wav", "speaker_embedding"], ["s1"]
+    else:
+        graph = _SpeakerEncoderGraph(model)
+        args = (x_wav, x_wav_len)
+        input_names, output_names = ["x_wav", "x_wav_len"], ["speaker_embedding", "speaker_pred"]
+
+    dynamic_axes = {
+        "y_wav": {0: "batch", 1: "mixture_len"},
+        "x_wav": {0: "batch", 1: "reference_len"},
+        "x_wav_len": {0: "batch"},
+        "speaker_embedding": {0: "batch"},
+        "s1": {0: "batch", 1: "mixture_len"},
+        "speaker_pred": {0: "batch"},
+    }
+    torch.onnx.export(
+        graph,
+        args,
+        path,
+        input_names=input_names,
+        output_names=output_names,
+        dynamic_axes={name: axes for name, axes in dynamic_axes.items() if name in input_names + output_names},
+        opset_version=opset_version,
+    )
+    logger.info(f"Model has been exported to {path} in {mode} mode.")
+
+
+class OnnxSpExPlus:
+    """
+    ONNX Runtime CPU inference backend with the same call convention as SpExPlusModel:
+    it takes a collated batch and returns a dict with the graph outputs as torch tensors.
+    """
+
+    def __init__(self, path: str, intra_op_num_threads: Optional[int] = None, inter_op_num_threads: Optional[int] = None, optimization_level: str = "all"):
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise ImportError("For ONNX inference install onnxruntime via \n\t pip install onnxruntime")
+
+        optimization_levels = {
+            "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+            "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+            "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+            "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+        }
+        options = ort.SessionOptions()
+        options.graph_optimization_level = optimization_levels[optimization_level]
+        if intra_op_num_threads is not None:
+            options.intra_op_num_threads = intra_op_num_threads
+        if inter_op_num_threads is not None:
+            options.inter_op_num_threads = inter_op_num_threads
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [node.name for node in self.session.get_inputs()]
+        self.output_names = [node.name for node in self.session.get_outputs()]
+
+    def __call__(self, **batch):
+        feeds = {name: batch[name].detach().cpu().to(torch.float32).numpy() for name in self.input_names}
+        outputs = self.session.run(self.output_names, feeds)
+        return {name: torch.from_numpy(output) for name, output in zip(self.output_names, outputs)}
@@ -0,0 +1,73 @@
+import copy
+import logging
+from typing import Iterable
+
+import torch
+from torch import nn
+from torch.ao.quantization import QuantWrapper, convert, fuse_modules, get_default_qconfig, prepare
+
+from src.model.spex_plus_model import SpExPlusModel
+
+logger = logging.getLogger(__name__)
+
+
+def _wrap(parent: nn.Module, name: str, qconfig):
+    wrapper = QuantWrapper(getattr(parent, name))
+    wrapper.qconfig = qconfig
+    setattr(parent, name, wrapper)
+
+
+def _fuse_and_wrap(model: SpExPlusModel, qconfig):
+    """
+    Fuses conv+bn / conv+relu pairs and wraps every 1x1 conv (and the speaker classifier)
+    with quant/dequant stubs, so the rest of the network keeps running in fp32.
+    PReLU has no fused quantized kernel, hence conv+prelu pairs are quantized as separate convs.
+    """
+    speaker_encoder = model.speaker_encoder
+    for block in speaker_encoder.resnet_blocks:
+        fuse_modules(block.part1, [["0", "1"], ["3", "4"]], inplace=True)
+        _wrap(block.part1, "0", qconfig)
+        _wrap(block.part1, "3", qconfig)
+    for name in ["conv1", "conv2", "classification"]:
+        _wrap(speaker_encoder, name, qconfig)
+
+    speaker_extractor = model.speaker_extractor
+    _wrap(speaker_extractor, "conv1", qconfig)
+    for i, conv in enumerate(speaker_extractor.convs):
+        fuse_modules(conv, [["0", "1"]], inplace=True)
+        _wrap(speaker_extractor.convs, str(i), qconfig)
+    for stacked_TCNs in speaker_extractor.stacked_TCNs:
+        for tcn in stacked_TCNs.tcns:
+            _wrap(tcn.seq, "0", qconfig)
+            _wrap(tcn.seq, "6", qconfig)
+
+
+@torch.no_grad()
+def quantize_model(model: SpExPlusModel, calibration_batches: Iterable[dict], backend: str = "x86") -> SpExPlusModel:
+    """
+    Post-training static int8 quantization of SpEx+ for CPU inference.
+
+    :param model: trained fp32 model, it is not modified.
+    :param calibration_batches: collated batches used to collect activation ranges.
+    :param backend: quantized engine, "x86"/"fbgemm" for x86 servers or "qnnpack" for ARM.
+    :return: quantized copy of the model placed on CPU.
+    """
+    if isinstance(model, nn.DataParallel):
+        model = model.module
+    torch.backends.quantized.engine = backend
+    qconfig = get_default_qconfig(backend)
+
+    model = copy.deepcopy(model).cpu().eval()
+    _fuse_and_wrap(model, qconfig)
+    prepare(model, inplace=True)
+
+    calibrated = 0
+    for batch in calibration_batches:
+        model(**{k: v.cpu() if torch.is_tensor(v) else v for k, v in batch.items()})
+        calibrated += 1
+    if calibrated == 0:
+        logger.warning("Quantization is performed without calibration data, activation ranges are undefined.")
+    logger.info(f"Model has been calibrated on {calibrated} batches.")
+
+    convert(model, inplace=True)
+    return model
@@ -0,0 +1,280 @@
+import base64
+import itertools
+import json
+import logging
+import os
+import queue
+import socketserver
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+logger = logging.getLogger(__name__)
+
+
+def encode_audio(wav: np.ndarray) -> str:
+    return base64.b64encode(np.ascontiguousarray(wav, dtype="<f4").tobytes()).decode("ascii")
+
+
+def decode_audio(data: str) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(data), dtype="<f4")
+
+
+def pad_stack(wavs: List[np.ndarray]) -> torch.Tensor:
+    max_len = max(len(wav) for wav in wavs)
+    return torch.stack([F.pad(torch.from_numpy(wav.copy()), (0, max_len - len(wav))) for wav in wavs])
+
+
+def group_by_length(requests: list, length_tolerance: float) -> List[list]:
+    """
+    Splits requests sorted by mixture length into groups whose longest mixture is at most
+    `length_tolerance` times longer than the shortest one, so little compute is spent on padding.
+    Padding does not change the outputs, since the model is run with the valid mixture lengths.
+    """
+    requests = sorted(requests, key=lambda request: len(request["mixture"]))
+    groups = [[requests[0]]]
+    for request in requests[1:]:
+        if len(request["mixture"]) > length_tolerance * len(groups[-1][0]["mixture"]):
+            groups.append([])
+        groups[-1].append(request)
+    return groups
+
+
+class SpExPlusWorker:
+    """
+    Model replica living in a separate process. Collects concurrent requests from the shared queue
+    into dynamic batches and runs them through SpExPlusModel.
+    """
+
+    def __init__(self, model, speaker_bank: Optional[dict], max_batch_size: int, max_wait_ms: float, length_tolerance: float):
+        self.model = model
+        self.speaker_bank = speaker_bank if speaker_bank is not None else {}
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.length_tolerance = length_tolerance
+
+    def collect(self, request_queue) -> Optional[list]:
+        request = request_queue.get()
+        if request is None:
+            return None
+        requests = [request]
+        deadline = time.monotonic() + self.max_wait
+        while len(requests) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                request = request_queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if request is None:
+                # keep the sentinel for the next collect call
+                request_queue.put(None)
+                break
+            requests.append(request)
+        return requests
+
+    @torch.no_grad()
+    def speaker_embeddings(self, requests: list) -> torch.Tensor:
+        references = [request["reference"] for request in requests if request["reference"] is not None]
+        if len(references) > 0:
+            # speaker pooling is masked, so references of different lengths are encoded in one batch
+            x_wav_len = torch.LongTensor([len(reference) for reference in references])
+            reference_embeddings = iter(self.model.get_speaker_embedding(pad_stack(references), x_wav_len)[1])
+        embeddings = []
+        for request in requests:
+            if request["reference"] is not None:
+                embeddings.append(next(reference_embeddings))
+            else:
+                embeddings.append(self.speaker_bank[request["speaker_id"]])
+        return torch.stack(embeddings)
+
+    @torch.no_grad()
+    def process(self, requests: list) -> list:
+        results = []
+        for group in group_by_length(requests, self.length_tolerance):
+            valid, errors = [], []
+            for request in group:
+                if request["reference"] is None and request["speaker_id"] not in self.speaker_bank:
+                    errors.append((request["id"], None, f"unknown speaker_id {request['speaker_id']}", len(group)))
+                else:
+                    valid.append(request)
+            results += errors
+            if len(valid) == 0:
+                continue
+            y_wav_len = torch.LongTensor([len(request["mixture"]) for request in valid])
+            s1, _, _ = self.model.extract(pad_stack([request["mixture"] for request in valid]), self.speaker_embeddings(valid), y_wav_len)
+            for request, wav in zip(valid, s1):
+                results.append((request["id"], wav[: len(request["mixture"])].numpy(), None, len(group)))
+        return results
+
+    def serve(self, request_queue, result_queue):
+        while (requests := self.collect(request_queue)) is not None:
+            try:
+                results = self.process(requests)
+            except Exception as e:
+                logger.exception("Batch processing failed")
+                results = [(request["id"], None, repr(e), len(requests)) for request in requests]
+            for result in results:
+                result_queue.put(result)
+
+
+def worker_main(worker_idx: int, config: dict, checkpoint_path: str, speaker_bank_path: Optional[str], request_queue, result_queue, args: dict):
+    from src.inference.utils import load_ss_model
+
+    threads = args["threads"]
+    torch.set_num_threads(threads)
+    torch.set_num_interop_threads(1)
+    if args["pin_cores"] and hasattr(os, "sched_setaffinity"):
+        cores = sorted(os.sched_getaffinity(0))
+        os.sched_setaffinity(0, cores[(worker_idx * threads) % len(cores) :][:threads])
+
+    model = load_ss_model(config, checkpoint_path, torch.device("cpu"))
+    speaker_bank = torch.load(speaker_bank_path) if speaker_bank_path is not None else None
+    worker = SpExPlusWorker(model, speaker_bank, args["max_batch_size"], args["max_wait_ms"], args["length_tolerance"])
+    logger.info(f"Worker {worker_idx} is ready.")
+    worker.serve(request_queue, result_queue)
+
+
+class ServerState:
+    """
+    Request bookkeeping of the frontend process: routes worker results back to waiting
+    http handlers and keeps latency statistics.
+    """
+
+    def __init__(self, request_queue, result_queue, timeout: float, stats_window: int = 10000):
+        self.request_queue = request_queue
+        self.result_queue = result_queue
+        self.timeout = timeout
+        self._ids = itertools.count()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.latencies = deque(maxlen=stats_window)
+        self.batch_sizes = deque(maxlen=stats_window)
+        self.requests_cnt = 0
+        self.errors_cnt = 0
+        self._dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+        self._dispatcher.start()
+
+    def _dispatch(self):
+        while (result := self.result_queue.get()) is not None:
+            request_id, wav, error, batch_size = result
+            with self._lock:
+                pending = self._pending.pop(request_id, None)
+                self.batch_sizes.append(batch_size)
+            if pending is not None:
+                pending["result"] = (wav, error)
+                pending["event"].set()
+
+    def submit(self, mixture: np.ndarray, reference: Optional[np.ndarray], speaker_id: Optional[str]):
+        start_time = time.perf_counter()
+        request_id = next(self._ids)
+        pending = {"event": threading.Event(), "result": (None, "timeout")}
+        with self._lock:
+            self._pending[request_id] = pending
+        self.request_queue.put({"id": request_id, "mixture": mixture, "reference": reference, "speaker_id": speaker_id})
+        if not pending["event"].wait(self.timeout):
+            with self._lock:
+                self._pending.pop(request_id, None)
+        latency = time.perf_counter() - start_time
+        wav, error = pending["result"]
+        with self._lock:
+            self.requests_cnt += 1
+            if error is None:
+                self.latencies.append(latency)
+            else:
+                self.errors_cnt += 1
+        return wav, error, latency
+
+    def queue_depth(self) -> int:
+        try:
+            return self.request_queue.qsize()
+        except NotImplementedError:
+            # multiprocessing queues have no qsize on macOS
+            return -1
+
+    def metrics(self) -> dict:
+        with self._lock:
+            latencies = np.array(self.latencies) * 1000
+            batch_sizes = np.array(self.batch_sizes)
+            in_flight = len(self._pending)
+            requests_cnt, errors_cnt = self.requests_cnt, self.errors_cnt
+        return {
+            "requests": requests_cnt,
+            "errors": errors_cnt,
+            "in_flight": in_flight,
+            "queue_depth": self.queue_depth(),
+            "p50_ms": float(np.percentile(latencies, 50)) if len(latencies) else None,
+            "p99_ms": float(np.percentile(latencies, 99)) if len(latencies) else None,
+            "mean_batch_size": float(batch_sizes.mean()) if len(batch_sizes) else None,
+        }
+
+
+class SpExPlusRequestHandler(BaseHTTPRequestHandler):
+    """
+    POST /extract  {"mixture": b64 float32, "reference": b64 float32} or {"mixture": ..., "speaker_id": id}
+                   -> {"s1": b64 float32, "latency_ms": float}
+    GET /metrics   -> latency percentiles, queue depth and mean dynamic batch size
+    """
+
+    protocol_version = "HTTP/1.1"
+    state: ServerState = None
+
+    def _send_json(self, code: int, content: dict):
+        body = json.dumps(content).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            self._send_json(200, self.state.metrics())
+        else:
+            self._send_json(404, {"error": f"unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path != "/extract":
+            self._send_json(404, {"error": f"unknown path {self.path}"})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            mixture = decode_audio(request["mixture"])
+            reference = decode_audio(request["reference"]) if request.get("reference") is not None else None
+            speaker_id = str(request["speaker_id"]) if request.get("speaker_id") is not None else None
+            assert reference is not None or speaker_id is not None, "reference or speaker_id must be provided"
+        except (KeyError, ValueError, TypeError, AssertionError) as e:
+            self._send_json(400, {"error": repr(e)})
+            return
+        wav, error, latency = self.state.submit(mixture, reference, speaker_id)
+        if error is not None:
+            self._send_json(500, {"error": error})
+        else:
+            self._send_json(200, {"s1": encode_audio(wav), "latency_ms": 1000 * latency})
+
+    def address_string(self):
+        # unix socket clients have no address
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_http_server(state: ServerState, host: str = "127.0.0.1", port: int = 8000, unix_socket: Optional[str] = None):
+    handler = type("Handler", (SpExPlusRequestHandler,), {"state": state})
+    if unix_socket is not None:
+        if os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        return ThreadingUnixHTTPServer(unix_socket, handler)
+    return ThreadingHTTPServer((host, port), handler)
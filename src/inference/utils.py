@@ -0,0 +1,85 @@
+import logging
+import pickle
+
+import torch
+
+import src.model as module_model
+from src.utils.parse_config import ConfigParser
+
+logger = logging.getLogger(__name__)
+
+
+WEIGHTS_FORMAT = "ss_weights"
+
+
+def export_weights(model, arch_config: dict, path: str, ema: bool = False):
+    """
+    Saves a slim inference checkpoint: a flat name -> tensor dict and the architecture config,
+    without optimizer state and pickled objects, so it is loaded with weights_only=True and mmap.
+
+    :param ema: the model holds exponential moving average of weights, recorded for load_ss_model.
+    """
+    state_dict = {k: v.detach().cpu().contiguous() for k, v in model.state_dict().items()}
+    torch.save({"format": WEIGHTS_FORMAT, "arch": arch_config, "state_dict": state_dict, "ema": ema}, path)
+
+
+def _load_weights(checkpoint_path: str):
+    try:
+        checkpoint = torch.load(checkpoint_path, map_location="cpu", mmap=True, weights_only=True)
+    except (pickle.UnpicklingError, RuntimeError):
+        # training checkpoints contain pickled objects or use the legacy serialization
+        return None
+    return checkpoint if isinstance(checkpoint, dict) and checkpoint.get("format") == WEIGHTS_FORMAT else None
+
+
+def load_ss_model(config: ConfigParser, checkpoint_path: str, device: torch.device, arch: str = "ss_arch", ema: bool = False):
+    """
+    Builds the speech separation model described by `config[arch]` and loads trained weights into it.
+    `config` may be a ConfigParser or a plain config dict, it is not needed for checkpoints exported by export_weights.
+    Exported checkpoints are memory-mapped and assigned to a model created on the meta device,
+    so weights are neither initialized nor copied.
+
+    :param ema: load exponential moving average of weights, exported checkpoints must have been exported with them.
+    """
+    logger.info(f"Loading checkpoint {checkpoint_path}...")
+    checkpoint = _load_weights(checkpoint_path)
+    if checkpoint is not None:
+        if ema and not checkpoint.get("ema", False):
+            raise ValueError(f"Checkpoint {checkpoint_path} has no EMA weights, export them with --ema")
+        with torch.device("meta"):
+            model = ConfigParser.init_obj(checkpoint["arch"], module_model)
+        model.load_state_dict(checkpoint["state_dict"], assign=True)
+        logger.info("Weights have been loaded.")
+        return model.to(device).eval()
+
+    model = ConfigParser.init_obj(config[arch], module_model)
+    checkpoint = torch.load(checkpoint_path, map_location=device)
+    if ema:
+        assert checkpoint.get("ema_state_dict") is not None, "Checkpoint has no EMA weights"
+        state_dict = checkpoint["ema_state_dict"]["module"]
+    else:
+        state_dict = checkpoint["state_dict"]
+    # checkpoints of DataParallel models store weights with "module." prefix
+    state_dict = {k[len("module.") :] if k.startswith("module.") else k: v for k, v in state_dict.items()}
+    model.load_state_dict(state_dict)
+    logger.info("Checkpoint has been loaded.")
+    return model.to(device).eval()
+
+
+@torch.no_grad()
+def build_speaker_bank(model, dataset, device: torch.device) -> dict:
+    """
+    Enrolls speakers of a MixtureDataset: the speaker embedding is averaged over all references of the speaker.
+    Speakers are keyed by the original LibriSpeech speaker id.
+    """
+    from src.collate_fn.ss_collate import ss_collate_fn
+    from src.datasets.mixture_dataset import get_speaker_id_by_path
+
+    sums, counts = {}, {}
+    for i in range(len(dataset)):
+        batch = ss_collate_fn([dataset[i]])
+        speaker_id = str(get_speaker_id_by_path(dataset._index[3 * i]))
+        _, embedding = model.get_speaker_embedding(batch["x_wav"].to(device), batch["x_wav_len"])
+        sums[speaker_id] = sums.get(speaker_id, 0) + embedding[0].cpu()
+        counts[speaker_id] = counts.get(speaker_id, 0) + 1
+    return {speaker_id: sums[speaker_id] / counts[speaker_id] for speaker_id in sums}
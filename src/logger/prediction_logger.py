@@ -0,0 +1,91 @@
+import logging
+import queue
+import threading
+
+import numpy as np
+import torch
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncPredictionLogger:
+    """
+    Logs tables of predicted examples from a background thread. The training loop only starts
+    device to host copies of a few examples and enqueues them; per-example metrics, audio encoding
+    and the upload run in the worker. When the bounded queue is full, examples are dropped instead
+    of blocking the training step.
+    """
+
+    def __init__(self, writer, metrics, examples_to_log=2, max_queue_size=4, sample_rate=16000):
+        self.writer = writer
+        self.metrics = metrics
+        self.examples_to_log = examples_to_log
+        self.sample_rate = sample_rate
+        self.dropped_cnt = 0
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._worker = threading.Thread(target=self._work, daemon=True)
+        self._worker.start()
+
+    def log(self, step, mode, is_train, **batch):
+        if self._queue.full():
+            self.dropped_cnt += 1
+            return
+        batch_size = batch["y_wav"].shape[0]
+        ids = torch.from_numpy(np.random.choice(batch_size, min(self.examples_to_log, batch_size), replace=False))
+        examples = {}
+        for key, value in batch.items():
+            if torch.is_tensor(value) and value.dim() > 0 and value.shape[0] == batch_size:
+                value = value.detach()
+                examples[key] = value[ids.to(value.device)].to("cpu", non_blocking=True)
+        # copies are read by the worker only after the event, so the training step does not wait for them
+        event = None
+        if batch["y_wav"].is_cuda:
+            event = torch.cuda.Event()
+            event.record()
+        try:
+            self._queue.put_nowait((step, mode, is_train, event, examples))
+        except queue.Full:
+            self.dropped_cnt += 1
+
+    def _work(self):
+        while (item := self._queue.get()) is not None:
+            try:
+                self._log_table(*item)
+            except Exception:
+                logger.exception("Prediction logging failed")
+
+    def _log_table(self, step, mode, is_train, event, examples):
+        if event is not None:
+            event.synchronize()
+
+        def get_wandb_audio(tensor):
+            return self.writer.wandb.Audio(tensor.to(torch.float32).numpy(), sample_rate=self.sample_rate)
+
+        rows = {}
+        for i in range(examples["y_wav"].shape[0]):
+            rows[i] = {
+                # the table is logged at a later step, when the worker gets to it
+                "step": step,
+                "norm_pred": get_wandb_audio(examples["normalized_s"][i]),
+                "mixed": get_wandb_audio(examples["y_wav"][i]),
+                "ref": get_wandb_audio(examples["x_wav"][i]),
+                "target": get_wandb_audio(examples["target_wav"][i]),
+            }
+            kwargs = {key: value[i].unsqueeze(0) for key, value in examples.items()}
+            for metric in self.metrics:
+                if not is_train and metric.skip_on_test:
+                    continue
+                rows[i].update({metric.name: float(metric(**kwargs))})
+
+        import pandas as pd
+
+        self.writer.add_table("predictions", pd.DataFrame.from_dict(rows, orient="index"), mode=mode)
+
+    def close(self):
+        """
+        Logs the queued examples and stops the worker.
+        """
+        self._queue.put(None)
+        self._worker.join()
+        if self.dropped_cnt > 0:
+            logger.info(f"{self.dropped_cnt} prediction tables were dropped because the logging queue was full.")
@@ -1,9 +1,9 @@
 import io
 
-import matplotlib.pyplot as plt
-
 
 def plot_spectrogram_to_buf(spectrogram_tensor, name=None):
+    import matplotlib.pyplot as plt
+
     plt.figure(figsize=(20, 5))
     plt.imshow(spectrogram_tensor)
     plt.title(name)
@@ -1,8 +1,6 @@
 from datetime import datetime
 
 import numpy as np
-import pandas as pd
-import wandb
 
 
 class WanDBWriter:
@@ -38,8 +36,8 @@ class WanDBWriter:
             self.add_scalar("steps_per_sec", 1 / duration.total_seconds())
             self.timer = datetime.now()
 
-    def _scalar_name(self, scalar_name):
-        return f"{scalar_name}_{self.mode}"
+    def _scalar_name(self, scalar_name, mode=None):
+        return f"{scalar_name}_{self.mode if mode is None else mode}"
 
     def add_scalar(self, scalar_name, scalar):
         self.wandb.log({self._scalar_name(scalar_name): scalar}, step=self.step)
@@ -67,8 +65,13 @@ class WanDBWriter:
 
         self.wandb.log({self._scalar_name(scalar_name): hist}, step=self.step)
 
-    def add_table(self, table_name, table: pd.DataFrame):
-        self.wandb.log({self._scalar_name(table_name): wandb.Table(dataframe=table)}, step=self.step)
+    def add_table(self, table_name, table, mode=None):
+        """
+        :param table: pandas DataFrame.
+        :param mode: explicit mode for logging from background threads, the current one is used by default.
+                     Tables are always logged at the current step, wandb drops steps older than the last logged one.
+        """
+        self.wandb.log({self._scalar_name(table_name, mode): self.wandb.Table(dataframe=table)}, step=self.step)
 
     def add_images(self, scalar_name, images):
         raise NotImplementedError()
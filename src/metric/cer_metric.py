@@ -16,15 +16,12 @@ class ArgmaxCERMetric(BaseMetric):
 
     def __call__(self, pred_log_probs: Tensor, target_log_probs: Tensor, lengths, text: List[str], **kwargs):
         cers = []
-        if "target" in self.name:
-            predictions = torch.argmax(target_log_probs.cpu(), dim=-1).numpy()
+        log_probs = target_log_probs if "target" in self.name else pred_log_probs
+        if hasattr(self.text_encoder, "ctc_decode_batch"):
+            pred_texts = self.text_encoder.ctc_decode_batch(log_probs)
         else:
-            predictions = torch.argmax(pred_log_probs.cpu(), dim=-1).numpy()
-        for log_prob_vec, length, target_text in zip(predictions, lengths, text):
+            pred_texts = [self.text_encoder.decode(inds) for inds in torch.argmax(log_probs.cpu(), dim=-1).numpy()]
+        for pred_text, length, target_text in zip(pred_texts, lengths, text):
             target_text = BaseTextEncoder.normalize_text(target_text)
-            if hasattr(self.text_encoder, "ctc_decode"):
-                pred_text = self.text_encoder.ctc_decode(log_prob_vec)[:length]
-            else:
-                pred_text = self.text_encoder.decode(log_prob_vec)[:length]
-            cers.append(calc_cer(target_text, pred_text))
+            cers.append(calc_cer(target_text, pred_text[:length]))
         return sum(cers) / len(cers)
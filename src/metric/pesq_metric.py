@@ -1,20 +1,79 @@
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
 from src.base.base_metric import BaseMetric
-from torchmetrics.audio.pesq import PerceptualEvaluationSpeechQuality
 
 
-class PESQMetric(BaseMetric):
-    def __init__(self, fs=16000, mode="wb", *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.metric = PerceptualEvaluationSpeechQuality(fs, mode)
+def _pesq_scores(fs, mode, preds, targets):
+    from pesq import pesq
 
-    def __call__(self, normalized_s, target_wav, **kwargs):
-        return self.metric(normalized_s, target_wav)
+    return [pesq(fs, target, pred, mode) for pred, target in zip(preds, targets)]
 
 
-class SegmentedPESQMetric(BaseMetric):
-    def __init__(self, fs=16000, mode="wb", *args, **kwargs):
+class _PESQBase(BaseMetric):
+    def __init__(self, fs=16000, mode="wb", num_workers=0, *args, **kwargs):
+        """
+        :param num_workers: size of the process pool used by submit. PESQ is computed by the cpu reference
+                            implementation, so evaluation loops submit batches to the pool and gather
+                            the scores at the end instead of waiting for them after every forward pass.
+                            With 0 workers submit computes scores synchronously.
+        """
         super().__init__(*args, **kwargs)
-        self.metric = PerceptualEvaluationSpeechQuality(fs, mode)
+        self.fs = fs
+        self.mode = mode
+        self.num_workers = num_workers
+        self._executor = None
+        self._pending = []
+
+    def _inputs(self, **batch):
+        raise NotImplementedError()
+
+    def __call__(self, **batch):
+        scores = _pesq_scores(self.fs, self.mode, *self._inputs(**batch))
+        return sum(scores) / len(scores)
+
+    def submit(self, **batch):
+        preds, targets = self._inputs(**batch)
+        if self.num_workers == 0:
+            self._pending.append(_pesq_scores(self.fs, self.mode, preds, targets))
+            return
+        if self._executor is None:
+            # spawn, since the evaluating process may hold cuda context and logger threads
+            self._executor = ProcessPoolExecutor(self.num_workers, mp_context=mp.get_context("spawn"))
+        self._pending.append(self._executor.submit(_pesq_scores, self.fs, self.mode, preds, targets))
+
+    def gather(self):
+        """
+        Waits for all submitted batches.
+
+        :return: mean score over submitted utterances and their count.
+        """
+        scores = []
+        for pending in self._pending:
+            scores += pending if isinstance(pending, list) else pending.result()
+        self._pending = []
+        if len(scores) == 0:
+            return 0, 0
+        return sum(scores) / len(scores), len(scores)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+
+class PESQMetric(_PESQBase):
+    def _inputs(self, normalized_s, target_wav, y_wav_len=None, **kwargs):
+        preds = normalized_s.detach().float().cpu().numpy()
+        targets = target_wav.detach().float().cpu().numpy()
+        lengths = y_wav_len.tolist() if y_wav_len is not None else [preds.shape[-1]] * preds.shape[0]
+        preds = [np.ascontiguousarray(pred[:length]) for pred, length in zip(preds, lengths)]
+        targets = [np.ascontiguousarray(target[:length]) for target, length in zip(targets, lengths)]
+        return preds, targets
+
 
-    def __call__(self, segmented_s, cut_target_wav, **kwargs):
-        return self.metric(segmented_s, cut_target_wav)
+class SegmentedPESQMetric(_PESQBase):
+    def _inputs(self, segmented_s, cut_target_wav, **kwargs):
+        return list(segmented_s.detach().float().cpu().numpy()), list(cut_target_wav.detach().float().cpu().numpy())
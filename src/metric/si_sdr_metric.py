@@ -1,20 +1,26 @@
 from src.base.base_metric import BaseMetric
-from torchmetrics.audio import ScaleInvariantSignalDistortionRatio
+from src.metric.utils import si_sdr
 
 
 class SISDRMetric(BaseMetric):
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, sync=False, **kwargs):
+        """
+        :param sync: if False, the batch value stays a device tensor, so it is synchronized
+                     with host only when the metric tracker is read at logging steps.
+        """
         super().__init__(*args, **kwargs)
-        self.metric = ScaleInvariantSignalDistortionRatio()
+        self.sync = sync
 
-    def __call__(self, s1, target_wav, **kwargs):
-        return self.metric.to(s1.device)(s1, target_wav).item()
+    def __call__(self, s1, target_wav, y_wav_len=None, **kwargs):
+        value = si_sdr(s1, target_wav, y_wav_len).mean().detach()
+        return value.item() if self.sync else value
 
 
 class SegmentedSISDRMetric(BaseMetric):
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, sync=False, **kwargs):
         super().__init__(*args, **kwargs)
-        self.metric = ScaleInvariantSignalDistortionRatio()
+        self.sync = sync
 
     def __call__(self, segmented_s, cut_target_wav, **kwargs):
-        return self.metric.to(segmented_s.device)(segmented_s, cut_target_wav).item()
+        value = si_sdr(segmented_s, cut_target_wav).mean().detach()
+        return value.item() if self.sync else value
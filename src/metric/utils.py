@@ -1,4 +1,5 @@
 import editdistance
+import torch
 
 
 def calc_cer(target_text, predicted_text) -> float:
@@ -13,3 +14,26 @@ def calc_wer(target_text, predicted_text) -> float:
     target_text_splitted = target_text.split(" ")
     predicted_text_splitted = predicted_text.split(" ")
     return editdistance.eval(target_text_splitted, predicted_text_splitted) / len(target_text_splitted)
+
+
+def si_sdr(estimated, target, lengths=None, zero_mean=False):
+    """
+    Per-utterance scale-invariant SDR of B x T batches, returns B values.
+    Samples beyond `lengths` are ignored. Accumulation is done in fp32 even under autocast.
+    """
+    estimated, target = estimated.to(torch.float32), target.to(torch.float32)
+    if lengths is not None:
+        mask = (torch.arange(target.shape[-1], device=target.device) < lengths.to(target.device).unsqueeze(-1)).to(torch.float32)
+        estimated, target = estimated * mask, target * mask
+    if zero_mean:
+        count = mask.sum(-1, keepdim=True) if lengths is not None else target.shape[-1]
+        estimated = estimated - estimated.sum(-1, keepdim=True) / count
+        target = target - target.sum(-1, keepdim=True) / count
+        if lengths is not None:
+            estimated, target = estimated * mask, target * mask
+
+    eps = torch.finfo(torch.float32).eps
+    alpha = ((estimated * target).sum(-1, keepdim=True) + eps) / ((target**2).sum(-1, keepdim=True) + eps)
+    target_scaled = alpha * target
+    noise = target_scaled - estimated
+    return 10 * torch.log10(((target_scaled**2).sum(-1) + eps) / ((noise**2).sum(-1) + eps))
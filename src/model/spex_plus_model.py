@@ -6,6 +6,13 @@ from src.base import BaseModel
 # https://www.isca-speech.org/archive/pdfs/interspeech_2020/ge20_interspeech.pdf
 
 
+def get_mask(lengths, max_len, dtype=torch.float32):
+    """
+    B -> B x 1 x max_len mask of valid (not padded) positions
+    """
+    return (torch.arange(max_len, device=lengths.device) < lengths.unsqueeze(-1)).unsqueeze(1).to(dtype)
+
+
 class SpeechEncoder(nn.Module):
     def __init__(self, L1, L2, L3, channels_cnt):
         super().__init__()
@@ -80,15 +87,24 @@ class SpeakerEncoder(nn.Module):
         self.classification = nn.Linear(channels_cnt, speakers_cnt)
 
     def forward(self, x, len):
+        """
+        Pools the embedding over valid frames of references. In eval mode padding does not affect it.
+        In train mode BatchNorm1d of ResNet blocks still computes batch statistics over padded frames,
+        so embeddings of padded references depend on the batch there.
+        """
+        # number of valid encoder frames of every reference, padding must not contribute to the pooled embedding
+        frames_cnt = (len.to(x.device).long() - self.L1) // self.stride + 1
         x = self.norm(x)
         x = self.conv1(x)
-        x = self.resnet_blocks(x)
+        for resnet_block in self.resnet_blocks:
+            x = resnet_block(x)
+            # max pooling windows of valid output frames contain only valid input frames
+            frames_cnt = frames_cnt // 3
         x = self.conv2(x)
 
-        final_len = (len - self.L1) // self.stride + 1
-        for _ in range(self.ResNetBlock_cnt):
-            final_len //= 3
-        speaker_embedding = torch.sum(x, -1) / final_len.view(-1, 1).to(x.device)
+        frames_cnt = frames_cnt.clamp(min=1)
+        mask = get_mask(frames_cnt, x.shape[-1], x.dtype)
+        speaker_embedding = torch.sum(x * mask, -1) / frames_cnt.view(-1, 1)
 
         return self.classification(speaker_embedding), speaker_embedding
 
@@ -100,11 +116,20 @@ class GlobalLayerNorm(nn.Module):
         self.beta = nn.Parameter(torch.zeros(dim, 1))
         self.gamma = nn.Parameter(torch.ones(dim, 1))
 
-    def forward(self, x):
-        mean = torch.mean(x, (1, 2), keepdim=True)
-        var = torch.mean((x - mean) ** 2, (1, 2), keepdim=True)
-        x = self.gamma * (x - mean) / torch.sqrt(var + self.eps) + self.beta
-        return x
+    def forward(self, x, mask=None):
+        # statistics are computed in fp32 under mixed precision
+        dtype = x.dtype
+        x = x.float()
+        if mask is None:
+            mean = torch.mean(x, (1, 2), keepdim=True)
+            var = torch.mean((x - mean) ** 2, (1, 2), keepdim=True)
+            return (self.gamma * (x - mean) / torch.sqrt(var + self.eps) + self.beta).to(dtype)
+
+        # statistics over valid frames only, padded frames are zeroed for the following convolutions
+        count = mask.sum((1, 2), keepdim=True) * x.shape[1]
+        mean = torch.sum(x * mask, (1, 2), keepdim=True) / count
+        var = torch.sum(((x - mean) * mask) ** 2, (1, 2), keepdim=True) / count
+        return ((self.gamma * (x - mean) / torch.sqrt(var + self.eps) + self.beta) * mask).to(dtype)
 
 
 class TCN(nn.Module):
@@ -123,11 +148,17 @@ class TCN(nn.Module):
             nn.Conv1d(TCN.mul * channels_cnt, channels_cnt, 1),
         )
 
-    def forward(self, x, speaker_embedding):
+    def forward(self, x, speaker_embedding, mask=None):
         if speaker_embedding is None:
-            return x + self.seq(x)
-        repeated_speaker_embedding = torch.unsqueeze(speaker_embedding, -1).repeat(1, 1, x.shape[-1])
-        return x + self.seq(torch.concat([x, repeated_speaker_embedding], dim=1))
+            out = x
+        else:
+            repeated_speaker_embedding = torch.unsqueeze(speaker_embedding, -1).repeat(1, 1, x.shape[-1])
+            out = torch.concat([x, repeated_speaker_embedding], dim=1)
+        if mask is None:
+            return x + self.seq(out)
+        for layer in self.seq:
+            out = layer(out, mask) if isinstance(layer, GlobalLayerNorm) else layer(out)
+        return x + out
 
 
 class StackedTCNs(nn.Module):
@@ -137,9 +168,9 @@ class StackedTCNs(nn.Module):
         tcns = [TCN(channels_cnt, 3, speaker_channels_cnt, 1)] + [TCN(channels_cnt, 3, 0, 2**i) for i in range(1, TCN_cnt)]
         self.tcns = nn.ModuleList(tcns)
 
-    def forward(self, x, speaker_embedding):
+    def forward(self, x, speaker_embedding, mask=None):
         for i, tcn in enumerate(self.tcns):
-            x = tcn(x, speaker_embedding) if i == 0 else tcn(x, None)
+            x = tcn(x, speaker_embedding, mask) if i == 0 else tcn(x, None, mask)
         return x
 
 
@@ -155,11 +186,12 @@ class SpeakerExtractor(nn.Module):
         self.stacked_TCNs = nn.ModuleList([StackedTCNs(channels_cnt, speaker_channels_cnt, TCN_cnt) for _ in range(4)])
         self.convs = nn.ModuleList([nn.Sequential(nn.Conv1d(channels_cnt, channels_cnt, 1), nn.ReLU()) for _ in range(3)])
 
-    def forward(self, x, speaker_embedding):
+    def forward(self, x, speaker_embedding, mask=None):
+        # Norm and 1x1 convolutions are frame-wise, padding can leak only through GlobalLayerNorm and depthwise convolutions
         x = self.norm(x)
         x = self.conv1(x)
         for stacked_TCNs in self.stacked_TCNs:
-            x = stacked_TCNs(x, speaker_embedding)
+            x = stacked_TCNs(x, speaker_embedding, mask)
 
         extracted_speech = [conv(x) for conv in self.convs]
         return extracted_speech
@@ -184,19 +216,39 @@ class SpExPlusModel(BaseModel):
         self.speaker_extractor = SpeakerExtractor(N, N, TCN_cnt)
         self.speech_decoder = SpeechDecoder(L1, L2, L3, N)
 
-    def forward(self, y_wav, x_wav, x_wav_len, **kwargs):
-        y, ys = self.speech_encoder(y_wav, True)
+    def get_speaker_embedding(self, x_wav, x_wav_len):
         x = self.speech_encoder(x_wav)
+        return self.speaker_encoder(x, x_wav_len)
 
-        speaker_preds, speaker_embedding = self.speaker_encoder(x, x_wav_len)
-
-        extracted_speech = self.speaker_extractor(y, speaker_embedding)
+    def extract(self, y_wav, speaker_embedding, y_wav_len=None):
+        """
+        :param y_wav_len: B, valid lengths of the padded mixtures. If it is given, padding does not affect
+                          the outputs, so batched and unbatched runs agree up to the last partial encoder frame.
+        """
+        y, ys = self.speech_encoder(y_wav, True)
+        if y_wav_len is None:
+            mask = None
+        else:
+            y_wav_len = y_wav_len.to(y.device).long()
+            frames_cnt = ((y_wav_len - self.speech_encoder.L1) // self.speech_encoder.stride + 1).clamp(min=1)
+            mask = get_mask(frames_cnt, y.shape[-1])
+        extracted_speech = self.speaker_extractor(y, speaker_embedding, mask)
+        if mask is not None:
+            ys = [ys[i] * mask for i in range(len(ys))]
         s_short, s_middle, s_long = self.speech_decoder(*[ys[i] * extracted_speech[i] for i in range(len(ys))])
         ylen = y_wav.shape[-1]
-
+        # s_short is never longer than y_wav, the tail shorter than the encoder stride is padded
+        s = [F.pad(s_short, (0, ylen - s_short.shape[-1])), s_middle[:, :ylen], s_long[:, :ylen]]
+        if y_wav_len is not None:
+            s = [s_i * get_mask(y_wav_len, ylen, s_i.dtype).squeeze(1) for s_i in s]
+        return s
+
+    def forward(self, y_wav, x_wav, x_wav_len, y_wav_len=None, **kwargs):
+        speaker_preds, speaker_embedding = self.get_speaker_embedding(x_wav, x_wav_len)
+        s1, s2, s3 = self.extract(y_wav, speaker_embedding, y_wav_len)
         return {
             "speaker_pred": speaker_preds,
-            "s1": F.pad(s_short[:, :ylen], (0, max(ylen - s_short.shape[1], 0))),
-            "s2": s_middle[:, :ylen],
-            "s3": s_long[:, :ylen],
+            "s1": s1,
+            "s2": s2,
+            "s3": s3,
         }
@@ -0,0 +1,29 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import torch
+
+from src.utils.checkpoint import AsyncCheckpointWriter
+
+
+class TestAsyncCheckpointWriter(unittest.TestCase):
+    def test_best_and_retention(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            writer = AsyncCheckpointWriter(tmp_dir, keep_last=2)
+            for epoch in range(1, 5):
+                writer.save({"epoch": torch.tensor(epoch)}, f"checkpoint-epoch{epoch}.pth", save_best=epoch == 2)
+            writer.close()
+
+            names = sorted(path.name for path in Path(tmp_dir).iterdir())
+            self.assertEqual(names, ["checkpoint-epoch3.pth", "checkpoint-epoch4.pth", "model_best.pth"])
+            self.assertEqual(torch.load(Path(tmp_dir) / "model_best.pth")["epoch"].item(), 2)
+
+    def test_best_without_hard_links(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            writer = AsyncCheckpointWriter(tmp_dir)
+            with mock.patch("os.link", side_effect=OSError("hard links are not supported")):
+                writer.save({"epoch": torch.tensor(1)}, "checkpoint-epoch1.pth", save_best=True)
+                writer.close()
+            self.assertEqual(torch.load(Path(tmp_dir) / "model_best.pth")["epoch"].item(), 1)
@@ -0,0 +1,64 @@
+import itertools
+import unittest
+from collections import defaultdict
+
+import numpy as np
+import torch
+
+from src.text_encoder import CTCCharTextEncoder
+from ctc_decoding import ctc_beam_search_batch, ctc_prefix_beam_search_batch
+
+
+class TestCTCDecoding(unittest.TestCase):
+    def test_ctc_decode_batch(self):
+        text_encoder = CTCCharTextEncoder()
+        log_probs = torch.randn(4, 48, len(text_encoder.ind2char))
+        # long runs of repeated characters and blanks
+        log_probs[:, ::3] = log_probs[:, 1::3] = log_probs[:, 2::3]
+        lengths = torch.tensor([48, 31, 1, 0])
+        texts = text_encoder.ctc_decode_batch(log_probs, lengths)
+        for log_prob, length, text in zip(log_probs, lengths, texts):
+            self.assertEqual(text_encoder.ctc_decode(log_prob[:length].argmax(-1).tolist()), text)
+        self.assertEqual(texts[3], "")
+        self.assertEqual(text_encoder.ctc_decode_batch(log_probs[:1]), texts[:1])
+
+    def test_beam_search(self):
+        text_encoder = CTCCharTextEncoder(["a", "b"])
+        rng = np.random.default_rng(0)
+        for _ in range(20):
+            probs = rng.dirichlet(np.ones(len(text_encoder.ind2char)), size=5)
+            # probabilities of texts summed over all alignments
+            text_probs = defaultdict(float)
+            for path in itertools.product(range(probs.shape[1]), repeat=probs.shape[0]):
+                text_probs[text_encoder.ctc_decode(list(path))] += np.prod(probs[np.arange(probs.shape[0]), path])
+            best_text = max(text_probs, key=text_probs.get)
+
+            hypos = text_encoder.ctc_prefix_beam_search(np.log(probs), beam_size=100)
+            self.assertEqual(hypos[0].text, best_text)
+            self.assertAlmostEqual(np.exp(hypos[0].prob), text_probs[best_text], places=5)
+            self.assertEqual(text_encoder.ctc_beam_search(probs, beam_size=100), best_text)
+
+        # repeated characters separated by blank are not merged
+        probs = np.array([[0, 1, 0], [1, 0, 0], [0, 1, 0]], dtype=np.float32)
+        self.assertEqual(text_encoder.ctc_beam_search(probs, beam_size=2), "aa")
+
+    def test_beam_search_batch(self):
+        text_encoder = CTCCharTextEncoder(["a", "b"])
+        rng = np.random.default_rng(1)
+        probs = rng.dirichlet(np.ones(len(text_encoder.ind2char)), size=(8, 5))
+        lengths = [5, 4, 3, 5, 1, 2, 0, 5]
+        hypos = ctc_prefix_beam_search_batch(np.log(probs), lengths, text_encoder.ind2char, text_encoder.char2ind[text_encoder.EMPTY_TOK], beam_size=100)
+        for utterance_probs, length, utterance_hypos in zip(probs, lengths, hypos):
+            # frames beyond the length are padding
+            utterance_probs = utterance_probs[:length]
+            text_probs = defaultdict(float)
+            for path in itertools.product(range(utterance_probs.shape[1]), repeat=length):
+                text_probs[text_encoder.ctc_decode(list(path))] += np.prod(utterance_probs[np.arange(length), path])
+            self.assertEqual(len(utterance_hypos), len(text_probs))
+            for hypo in utterance_hypos:
+                self.assertAlmostEqual(np.exp(hypo.prob), text_probs[hypo.text], places=5)
+            self.assertEqual(utterance_hypos[0].text, max(text_probs, key=text_probs.get))
+
+        texts = ctc_beam_search_batch(np.log(probs), lengths, text_encoder.ind2char, text_encoder.char2ind[text_encoder.EMPTY_TOK], beam_size=100)
+        self.assertEqual(texts, [utterance_hypos[0].text for utterance_hypos in hypos])
+        self.assertEqual(texts[6], "")
@@ -0,0 +1,231 @@
+import os
+import socket
+import tempfile
+import unittest
+from pathlib import Path
+
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from torch import nn
+from torch.distributed.algorithms.ddp_comm_hooks import default_hooks
+from torch.distributed.optim import ZeroRedundancyOptimizer
+from torch.nn.parallel import DistributedDataParallel
+
+from src.tests.utils import ToyModel, get_item_ids, get_toy_config, toy_loss, write_dataset
+from src.trainer import Trainer
+from src.utils import MetricTracker
+from src.utils.distributed import broadcast_object, init_distributed
+from src.utils.object_loading import get_dataloaders, get_optimizer
+from src.utils.parse_config import ConfigParser
+
+WORLD_SIZE = 2
+ITERS_TO_ACCUMULATE = 2
+DATASET_SIZE = 6
+LR = 0.1
+
+
+def get_config(tmp_dir, rank, name="distributed_test"):
+    # separate directories show which processes write checkpoints
+    config = get_toy_config(tmp_dir, Path(tmp_dir) / f"rank{rank}", name)
+    config["trainer"]["iters_to_accumulate"] = ITERS_TO_ACCUMULATE
+    return config
+
+
+def get_batches():
+    torch.manual_seed(0)
+    # WORLD_SIZE x ITERS_TO_ACCUMULATE micro batches
+    return torch.randn(WORLD_SIZE, ITERS_TO_ACCUMULATE, 4, 8), torch.randn(WORLD_SIZE, ITERS_TO_ACCUMULATE, 4, 8)
+
+
+def counting_allreduce_hook(calls, bucket):
+    calls.append(bucket.index())
+    return default_hooks.allreduce_hook(None, bucket)
+
+
+def init_worker(rank, port):
+    # the environment of torchrun
+    os.environ.update({"MASTER_ADDR": "127.0.0.1", "MASTER_PORT": str(port), "RANK": str(rank), "LOCAL_RANK": str(rank), "WORLD_SIZE": str(WORLD_SIZE)})
+    init_distributed()
+
+
+def run_worker(rank, tmp_dir, port):
+    init_worker(rank, port)
+    config = ConfigParser(get_config(tmp_dir, rank), run_id="")
+    device = torch.device("cpu")
+    result = {}
+
+    # evaluation shards of the process
+    dataloaders = get_dataloaders(config)
+    result["eval_ids"] = sum([get_item_ids(batch) for batch in dataloaders["val"]], [])
+
+    model = DistributedDataParallel(ToyModel())
+    allreduce_calls = []
+    model.register_comm_hook(allreduce_calls, counting_allreduce_hook)
+    optimizer = torch.optim.SGD(model.parameters(), lr=LR)
+    trainer = Trainer(model, toy_loss, [], optimizer, config, device, {"train": dataloaders["val"]}, len_epoch=ITERS_TO_ACCUMULATE)
+
+    # numbers of gradient all-reduces after every accumulated batch
+    result["allreduce_calls"] = []
+    x, y = get_batches()
+    for batch_idx in range(ITERS_TO_ACCUMULATE):
+        batch = {"y_wav": x[rank, batch_idx], "target_wav": y[rank, batch_idx], "y_wav_len": torch.full((4,), 8)}
+        trainer.process_batch(batch, True, batch_idx, trainer.train_metrics)
+        result["allreduce_calls"].append(len(allreduce_calls))
+    result["params"] = [p.detach().clone() for p in model.module.parameters()]
+
+    trainer._save_checkpoint(1)
+    if trainer.checkpoint_writer is not None:
+        trainer.checkpoint_writer.close()
+    result["checkpoints"] = sorted(path.name for path in config.save_dir.glob("*.pth"))
+
+    tracker = MetricTracker("loss")
+    tracker.update("loss", float(rank), n=rank + 1)
+    tracker.all_reduce(device)
+    result["loss"] = tracker.avg("loss")
+
+    torch.save(result, Path(tmp_dir) / f"result{rank}.pth")
+    dist.destroy_process_group()
+
+
+def get_zero_config(tmp_dir, rank, zero):
+    config = get_config(tmp_dir, rank, name=f"zero_{zero}_test")
+    config["optimizer"] = {"type": "AdamW", "args": {"lr": LR, "weight_decay": 0.1}, "zero": zero}
+    config["lr_scheduler"] = {"type": "StepLR", "args": {"step_size": 100}}
+    config["trainer"]["iters_to_accumulate"] = 1
+    return config
+
+
+def build_trainer(config, device):
+    model = DistributedDataParallel(ToyModel())
+    optimizer = get_optimizer(config, model.parameters())
+    lr_scheduler = config.init_obj(config["lr_scheduler"], torch.optim.lr_scheduler, optimizer)
+    dataloaders = get_dataloaders(config)
+    return Trainer(model, toy_loss, [], optimizer, config, device, {"train": dataloaders["val"]}, lr_scheduler=lr_scheduler, len_epoch=1)
+
+
+def get_optimizer_state(trainer):
+    """
+    Optimizer state of the parameters kept by the process, keyed by parameter indices.
+    """
+    optimizer = trainer.optimizer.optim if isinstance(trainer.optimizer, ZeroRedundancyOptimizer) else trainer.optimizer
+    params = list(trainer.model.parameters())
+    return {i: {k: v.clone() for k, v in optimizer.state[p].items()} for i, p in enumerate(params) if p in optimizer.state}
+
+
+def run_zero_worker(rank, tmp_dir, port):
+    init_worker(rank, port)
+    device = torch.device("cpu")
+    result = {}
+
+    config = ConfigParser(get_zero_config(tmp_dir, rank, zero=True), run_id="")
+    trainer = build_trainer(config, device)
+    x, y = get_batches()
+    for step in range(ITERS_TO_ACCUMULATE):
+        batch = {"y_wav": x[rank, step], "target_wav": y[rank, step], "y_wav_len": torch.full((4,), 8)}
+        trainer.process_batch(batch, True, 0, trainer.train_metrics)
+    result["sharded"] = get_optimizer_state(trainer)
+
+    # the sharded state is consolidated and written by the main process
+    trainer._save_checkpoint(1)
+    if trainer.checkpoint_writer is not None:
+        trainer.checkpoint_writer.close()
+    checkpoint_path = broadcast_object(str(config.save_dir / "checkpoint-epoch1.pth"))
+    dist.barrier()
+
+    # sharded and unsharded runs are resumed from the same checkpoint
+    for zero in [True, False]:
+        config = ConfigParser(get_zero_config(tmp_dir, rank, zero=zero), resume=checkpoint_path, use_previous_optimizer=True, run_id="")
+        trainer = build_trainer(config, device)
+        trainer._resume_checkpoint(checkpoint_path)
+        result[f"resumed, zero {zero}"] = get_optimizer_state(trainer)
+        result[f"lr, zero {zero}"] = trainer.optimizer.param_groups[0]["lr"]
+
+    torch.save(result, Path(tmp_dir) / f"zero_result{rank}.pth")
+    dist.destroy_process_group()
+
+
+def get_free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class TestDistributed(unittest.TestCase):
+    def test_distributed_training(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            write_dataset(tmp_dir, DATASET_SIZE)
+            mp.spawn(run_worker, args=(tmp_dir, get_free_port()), nprocs=WORLD_SIZE)
+            results = [torch.load(Path(tmp_dir) / f"result{rank}.pth") for rank in range(WORLD_SIZE)]
+
+        # evaluation shards don't overlap and cover the split
+        eval_ids = [result["eval_ids"] for result in results]
+        self.assertEqual(len(eval_ids[0]), DATASET_SIZE // WORLD_SIZE)
+        self.assertEqual(sorted(sum(eval_ids, [])), list(range(DATASET_SIZE)))
+
+        # gradients are all-reduced only on the last accumulated batch
+        for result in results:
+            self.assertEqual(result["allreduce_calls"][0], 0)
+            self.assertGreater(result["allreduce_calls"][1], 0)
+
+        # the optimizer step used the gradient over all micro batches of all processes
+        model = ToyModel()
+        x, y = get_batches()
+        nn.functional.mse_loss(model.net(x.flatten(0, 2)), y.flatten(0, 2)).backward()
+        for result in results:
+            for p, param in zip(model.parameters(), result["params"]):
+                self.assertTrue(torch.allclose(p.detach() - LR * p.grad, param, atol=1e-6))
+
+        # only the main process writes checkpoints
+        self.assertEqual(results[0]["checkpoints"], ["checkpoint-epoch1.pth"])
+        self.assertEqual(results[1]["checkpoints"], [])
+
+        # (0 * 1 + 1 * 2) / (1 + 2)
+        for result in results:
+            self.assertAlmostEqual(result["loss"], 2 / 3)
+
+    def assertStateEqual(self, state, reference_state):
+        self.assertEqual(state.keys(), reference_state.keys())
+        for key, value in state.items():
+            self.assertTrue(torch.allclose(torch.as_tensor(value, dtype=torch.float64), torch.as_tensor(reference_state[key], dtype=torch.float64), atol=1e-6), key)
+
+    def test_sharded_optimizer_checkpoint(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            write_dataset(tmp_dir, DATASET_SIZE)
+            mp.spawn(run_zero_worker, args=(tmp_dir, get_free_port()), nprocs=WORLD_SIZE)
+            results = [torch.load(Path(tmp_dir) / f"zero_result{rank}.pth") for rank in range(WORLD_SIZE)]
+            checkpoint = torch.load(Path(tmp_dir) / "rank0" / "models" / "zero_True_test" / "checkpoint-epoch1.pth")
+
+        # unsharded optimizer over gradients of all processes
+        model = ToyModel()
+        optimizer = torch.optim.AdamW(model.parameters(), lr=LR, weight_decay=0.1)
+        x, y = get_batches()
+        for step in range(ITERS_TO_ACCUMULATE):
+            nn.functional.mse_loss(model.net(x[:, step].flatten(0, 1)), y[:, step].flatten(0, 1)).backward()
+            optimizer.step()
+            optimizer.zero_grad()
+        reference = optimizer.state_dict()["state"]
+
+        # every parameter has its state on exactly one process
+        params_cnt = len(reference)
+        shards = [set(result["sharded"]) for result in results]
+        self.assertTrue(all(shards))
+        self.assertEqual(sorted(sum(map(list, shards), [])), list(range(params_cnt)))
+        for result in results:
+            for i, state in result["sharded"].items():
+                self.assertStateEqual(state, reference[i])
+
+        # the checkpoint holds the consolidated state in the format of the unsharded optimizer
+        self.assertEqual(sorted(checkpoint["optimizer"]["state"]), list(range(params_cnt)))
+        for i, state in checkpoint["optimizer"]["state"].items():
+            self.assertStateEqual(state, reference[i])
+
+        for rank, result in enumerate(results):
+            # a sharded run restores the shard of the process
+            self.assertEqual(set(result["resumed, zero True"]), shards[rank])
+            # an unsharded run restores the state of all parameters
+            self.assertEqual(set(result["resumed, zero False"]), set(range(params_cnt)))
+            for zero in [True, False]:
+                for i, state in result[f"resumed, zero {zero}"].items():
+                    self.assertStateEqual(state, reference[i])
+                self.assertAlmostEqual(result[f"lr, zero {zero}"], LR)
@@ -0,0 +1,79 @@
+import importlib.util
+import tempfile
+import unittest
+from pathlib import Path
+
+import torch
+
+import src.model as module_model
+from src.collate_fn.ss_collate import ss_collate_fn
+from src.inference import OnnxSpExPlus, export_onnx, export_weights, load_ss_model, quantize_model
+from src.metric.utils import si_sdr
+from src.utils.parse_config import ConfigParser
+
+ARCH = {"type": "SpExPlusModel", "args": {"L1": 20, "L2": 80, "L3": 160, "N": 16, "ResNetBlock_cnt": 3, "TCN_cnt": 2, "speakers_cnt": 5}}
+
+
+def get_batch(y_lens, x_lens):
+    items = [{"y_wav": torch.randn(1, y_len), "x_wav": torch.randn(1, x_len), "target_wav": torch.randn(1, y_len), "speaker_id": 0} for y_len, x_len in zip(y_lens, x_lens)]
+    return ss_collate_fn(items)
+
+
+class TestExportWeights(unittest.TestCase):
+    def test_ema_weights(self):
+        torch.manual_seed(0)
+        model = ConfigParser.init_obj(ARCH, module_model)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            weights_path = str(Path(tmp_dir) / "weights.pth")
+            export_weights(model, ARCH, weights_path)
+            loaded = load_ss_model(None, weights_path, torch.device("cpu"))
+            for name, value in model.state_dict().items():
+                self.assertTrue(torch.equal(loaded.state_dict()[name], value))
+            # the exported weights are not averaged
+            with self.assertRaises(ValueError):
+                load_ss_model(None, weights_path, torch.device("cpu"), ema=True)
+
+            ema_weights_path = str(Path(tmp_dir) / "ema_weights.pth")
+            export_weights(model, ARCH, ema_weights_path, ema=True)
+            load_ss_model(None, ema_weights_path, torch.device("cpu"), ema=True)
+
+
+class TestQuantization(unittest.TestCase):
+    @unittest.skipUnless("x86" in torch.backends.quantized.supported_engines, "x86 quantized engine is not available")
+    def test_quantized_model(self):
+        torch.manual_seed(0)
+        model = ConfigParser.init_obj(ARCH, module_model).eval()
+        calibration_batches = [get_batch([4000, 6001], [5000, 8000]) for _ in range(4)]
+        quantized = quantize_model(model, calibration_batches, backend="x86")
+        # the fp32 model is left as it is
+        self.assertIsInstance(model.speaker_extractor.conv1, torch.nn.Conv1d)
+
+        batch = get_batch([3000, 7013], [6000, 4321])
+        with torch.no_grad():
+            reference = model(**batch)
+            outputs = quantized(**batch)
+        for name in ["s1", "s2", "s3", "speaker_pred"]:
+            self.assertEqual(outputs[name].shape, reference[name].shape)
+        # int8 outputs stay close to fp32 ones
+        self.assertTrue(torch.all(si_sdr(outputs["s1"], reference["s1"], batch["y_wav_len"]) > 10))
+
+
+class TestOnnxExport(unittest.TestCase):
+    @unittest.skipUnless(importlib.util.find_spec("onnxruntime") is not None, "onnxruntime is not installed")
+    def test_onnx_matches_torch(self):
+        torch.manual_seed(0)
+        model = ConfigParser.init_obj(ARCH, module_model).eval()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = str(Path(tmp_dir) / "model.onnx")
+            export_onnx(model, path, mode="reference", sr=4000)
+            onnx_model = OnnxSpExPlus(path)
+            # batch sizes and lengths differ from the traced ones
+            for y_lens, x_lens in [([5000], [6000]), ([9371, 9371], [7777, 7777])]:
+                batch = get_batch(y_lens, x_lens)
+                outputs = onnx_model(**batch)
+                with torch.no_grad():
+                    speaker_pred, speaker_embedding = model.get_speaker_embedding(batch["x_wav"], batch["x_wav_len"])
+                    s1 = model.extract(batch["y_wav"], speaker_embedding)[0]
+                self.assertEqual(outputs["s1"].shape, s1.shape)
+                self.assertTrue(torch.allclose(outputs["s1"], s1, atol=1e-4))
+                self.assertTrue(torch.allclose(outputs["speaker_pred"], speaker_pred, atol=1e-4))
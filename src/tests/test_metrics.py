@@ -0,0 +1,37 @@
+import unittest
+
+import torch
+
+from src.metric.utils import si_sdr
+
+
+class TestSISDR(unittest.TestCase):
+    def test_per_utterance(self):
+        torch.manual_seed(0)
+        target = torch.randn(3, 1000)
+        estimated = target + 0.1 * torch.randn(3, 1000)
+        estimated[1] = 5 * target[1]
+        batched = si_sdr(estimated, target)
+        self.assertEqual(batched.shape, (3,))
+        for i in range(3):
+            self.assertTrue(torch.allclose(batched[i], si_sdr(estimated[i : i + 1], target[i : i + 1])[0]))
+        # scale invariance
+        self.assertGreater(batched[1].item(), 60)
+
+    def test_padding(self):
+        torch.manual_seed(0)
+        target = torch.randn(2, 1000)
+        estimated = target + 0.1 * torch.randn(2, 1000)
+        lengths = torch.LongTensor([1000, 600])
+        padded_estimated = estimated.clone()
+        padded_estimated[1, 600:] = torch.randn(400)
+        for zero_mean in [False, True]:
+            padded = si_sdr(padded_estimated, target, lengths, zero_mean=zero_mean)
+            unpadded = si_sdr(estimated[1:, :600], target[1:, :600], zero_mean=zero_mean)
+            self.assertTrue(torch.allclose(padded[1], unpadded[0], atol=1e-4))
+
+    def test_half_precision(self):
+        torch.manual_seed(0)
+        target = torch.randn(2, 1000)
+        estimated = target + 0.1 * torch.randn(2, 1000)
+        self.assertEqual(si_sdr(estimated.half(), target.half()).dtype, torch.float32)
@@ -0,0 +1,44 @@
+import unittest
+
+import torch
+
+from src.collate_fn.ss_collate import ss_collate_fn
+from src.model import SpExPlusModel
+
+
+def get_item(y_len, x_len):
+    return {"y_wav": torch.randn(1, y_len), "x_wav": torch.randn(1, x_len), "target_wav": torch.randn(1, y_len), "speaker_id": 0}
+
+
+class TestSpExPlusModel(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        self.model = SpExPlusModel(L1=20, L2=80, L3=160, N=16, ResNetBlock_cnt=3, TCN_cnt=2, speakers_cnt=5).eval()
+
+    @torch.no_grad()
+    def test_padded_mixtures(self):
+        x_wav = torch.randn(1, 8000)
+        items = [get_item(y_len, 8000) for y_len in [4000, 6001, 7013]]
+        for item in items:
+            item["x_wav"] = x_wav
+
+        batched = self.model(**ss_collate_fn(items))["s1"]
+        for i, item in enumerate(items):
+            unbatched = self.model(**ss_collate_fn([item]))["s1"]
+            # outputs agree everywhere except the tail not covered by the last full encoder frame
+            valid_len = item["y_wav"].shape[1] - self.model.speech_encoder.stride
+            self.assertTrue(torch.allclose(batched[i, :valid_len], unbatched[0, :valid_len], atol=1e-5))
+            self.assertTrue(torch.all(batched[i, item["y_wav"].shape[1] + 1 :] == 0))
+
+    @torch.no_grad()
+    def test_padded_references(self):
+        items = [get_item(4000, x_len) for x_len in [5000, 8000, 12345]]
+        batch = ss_collate_fn(items)
+        _, batched = self.model.get_speaker_embedding(batch["x_wav"], batch["x_wav_len"])
+        for i, item in enumerate(items):
+            batch = ss_collate_fn([item])
+            # an unpadded reference is valid up to its end, like an unpadded mixture
+            self.assertEqual(batch["x_wav_len"].item(), batch["x_wav"].shape[1])
+            self.assertEqual(batch["y_wav_len"].item(), batch["y_wav"].shape[1])
+            _, unbatched = self.model.get_speaker_embedding(batch["x_wav"], batch["x_wav_len"])
+            self.assertTrue(torch.allclose(batched[i], unbatched[0], atol=1e-5))
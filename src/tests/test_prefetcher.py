@@ -0,0 +1,29 @@
+import unittest
+
+import torch
+from torch.utils.data import DataLoader
+
+from src.collate_fn.ss_collate import ss_collate_fn
+from src.utils.prefetcher import DEVICE_KEYS, BatchPrefetcher
+
+
+def get_item(i):
+    return {"y_wav": torch.randn(1, 100 + i), "x_wav": torch.randn(1, 200 + i), "target_wav": torch.randn(1, 100 + i), "speaker_id": i}
+
+
+class TestBatchPrefetcher(unittest.TestCase):
+    def test_batches(self):
+        devices = [torch.device("cpu")]
+        if torch.cuda.is_available():
+            devices.append(torch.device("cuda"))
+        items = [get_item(i) for i in range(5)]
+        for device in devices:
+            dataloader = DataLoader(items, batch_size=2, collate_fn=ss_collate_fn, pin_memory=device.type == "cuda")
+            prefetcher = BatchPrefetcher(dataloader, device)
+            self.assertEqual(len(prefetcher), 3)
+            batches = list(prefetcher)
+            self.assertEqual(len(batches), 3)
+            for batch, expected in zip(batches, dataloader):
+                for key in DEVICE_KEYS:
+                    self.assertEqual(batch[key].device.type, device.type)
+                    self.assertTrue(torch.equal(batch[key].cpu(), expected[key]))
@@ -0,0 +1,25 @@
+import unittest
+
+from src.batch_sampler import ResumableSampler
+
+
+class TestResumableSampler(unittest.TestCase):
+    def test_resume(self):
+        sampler = ResumableSampler(range(10), seed=1)
+        first_pass, second_pass = list(sampler), list(sampler)
+        self.assertEqual(sorted(first_pass), list(range(10)))
+        self.assertNotEqual(first_pass, second_pass)
+
+        resumed = ResumableSampler(range(10), seed=1)
+        resumed.pass_idx, resumed.start_offset = 1, 4
+        self.assertEqual(list(resumed), second_pass[4:])
+        self.assertEqual(len(list(resumed)), 10)
+
+    def test_shards(self):
+        shards = [list(ResumableSampler(range(11), num_replicas=3, rank=rank)) for rank in range(3)]
+        for shard in shards:
+            self.assertEqual(len(shard), 4)
+        self.assertEqual(set(sum(shards, [])), set(range(11)))
+
+        shards = [list(ResumableSampler(range(11), drop_last=True, num_replicas=3, rank=rank)) for rank in range(3)]
+        self.assertEqual(len(set(sum(shards, []))), 9)
@@ -0,0 +1,98 @@
+import queue
+import threading
+import unittest
+
+import numpy as np
+import torch
+
+from src.inference.server import ServerState, SpExPlusWorker
+
+
+class FakeModel:
+    """
+    Scales mixtures by the speaker embedding, which is the mean of the reference, and records valid lengths of every batch.
+    """
+
+    def __init__(self):
+        self.batches = []
+
+    def get_speaker_embedding(self, x_wav, x_wav_len):
+        return None, x_wav.sum(-1, keepdim=True) / x_wav_len.unsqueeze(-1)
+
+    def extract(self, y_wav, speaker_embedding, y_wav_len=None):
+        self.batches.append(y_wav_len.tolist())
+        s1 = y_wav * speaker_embedding
+        return s1, s1, s1
+
+
+def get_request(request_id, mixture_len, reference=None, speaker_id=None):
+    mixture = np.arange(mixture_len, dtype=np.float32) + request_id
+    return {"id": request_id, "mixture": mixture, "reference": reference, "speaker_id": speaker_id}
+
+
+class TestServer(unittest.TestCase):
+    def test_dynamic_batching(self):
+        model = FakeModel()
+        worker = SpExPlusWorker(model, {"a": torch.Tensor([3])}, max_batch_size=4, max_wait_ms=100, length_tolerance=1.5)
+        requests = [
+            get_request(0, 100, reference=np.full(80, 2, dtype=np.float32)),
+            get_request(1, 400, speaker_id="a"),
+            get_request(2, 110, speaker_id="b"),
+            get_request(3, 105, reference=np.full(50, 0.5, dtype=np.float32)),
+            get_request(4, 120, speaker_id="a"),
+        ]
+        scales = {0: 2, 1: 3, 3: 0.5, 4: 3}
+        request_queue, result_queue = queue.Queue(), queue.Queue()
+        for request in requests + [None]:
+            request_queue.put(request)
+        worker.serve(request_queue, result_queue)
+
+        # the first 4 requests are collected together and split by mixture length, the last one waits for the next batch
+        self.assertEqual(model.batches, [[100, 105], [400], [120]])
+        results = {}
+        while not result_queue.empty():
+            request_id, wav, error, batch_size = result_queue.get()
+            results[request_id] = (wav, error, batch_size)
+        self.assertEqual(sorted(results), list(range(len(requests))))
+        self.assertEqual({request_id: result[2] for request_id, result in results.items()}, {0: 3, 1: 1, 2: 3, 3: 3, 4: 1})
+
+        # every request gets its own unpadded output and an unknown speaker fails only its request
+        self.assertIsNone(results[2][0])
+        self.assertIn("unknown speaker_id", results[2][1])
+        for request_id, scale in scales.items():
+            wav, error, _ = results[request_id]
+            self.assertIsNone(error)
+            self.assertTrue(np.allclose(wav, scale * requests[request_id]["mixture"]))
+
+    def test_concurrent_requests(self):
+        requests_cnt = 6
+        model = FakeModel()
+        worker = SpExPlusWorker(model, {}, max_batch_size=requests_cnt, max_wait_ms=1000, length_tolerance=10)
+        request_queue, result_queue = queue.Queue(), queue.Queue()
+        worker_thread = threading.Thread(target=worker.serve, args=(request_queue, result_queue))
+        worker_thread.start()
+        state = ServerState(request_queue, result_queue, timeout=10)
+
+        results = [None] * requests_cnt
+
+        def submit(i):
+            reference = np.full(100, i + 1, dtype=np.float32)
+            results[i] = state.submit(np.ones(200 + 10 * i, dtype=np.float32), reference, None)
+
+        threads = [threading.Thread(target=submit, args=(i,)) for i in range(requests_cnt)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        request_queue.put(None)
+        worker_thread.join()
+        result_queue.put(None)
+
+        # every caller gets the output of its own request
+        for i, (wav, error, _) in enumerate(results):
+            self.assertIsNone(error)
+            self.assertTrue(np.allclose(wav, np.full(200 + 10 * i, i + 1)))
+        # concurrent requests are processed in shared batches
+        self.assertLess(len(model.batches), requests_cnt)
+        self.assertEqual(sum(len(batch) for batch in model.batches), requests_cnt)
+        self.assertEqual(state.metrics()["requests"], requests_cnt)
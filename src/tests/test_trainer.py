@@ -0,0 +1,101 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import torch
+from torch.utils.data import DataLoader
+
+from src.batch_sampler import ResumableSampler
+from src.collate_fn.ss_collate import ss_collate_fn
+from src.tests.utils import ToyModel, get_item_ids, get_toy_config, toy_loss, write_dataset
+from src.trainer import Trainer
+from src.utils.object_loading import get_dataloaders, get_optimizer
+from src.utils.parse_config import ConfigParser
+
+
+def get_trainer(config: ConfigParser, resumable=False, len_epoch=None):
+    """
+    Trains on the "val" split of the toy config, as the train split of get_dataloaders with `resumable`.
+    """
+    dataloader = get_dataloaders(config)["val"]
+    if resumable:
+        sampler = ResumableSampler(dataloader.dataset, drop_last=True)
+        dataloader = DataLoader(dataloader.dataset, batch_size=dataloader.batch_size, sampler=sampler, collate_fn=ss_collate_fn, drop_last=True)
+    model = ToyModel()
+    optimizer = get_optimizer(config, model.parameters())
+    lr_scheduler = config.init_obj(config["lr_scheduler"], torch.optim.lr_scheduler, optimizer)
+    return Trainer(model, toy_loss, [], optimizer, config, torch.device("cpu"), {"train": dataloader}, lr_scheduler=lr_scheduler, len_epoch=len_epoch)
+
+
+def train(trainer):
+    """
+    :return: ids of items of every trained batch.
+    """
+    batches = []
+    process_batch = trainer.process_batch
+
+    def recording_process_batch(batch, *args, **kwargs):
+        batches.append(get_item_ids(batch))
+        return process_batch(batch, *args, **kwargs)
+
+    trainer.process_batch = recording_process_batch
+    trainer.train()
+    return batches
+
+
+def get_batch():
+    return {"y_wav": torch.randn(4, 8), "target_wav": torch.randn(4, 8), "y_wav_len": torch.full((4,), 8)}
+
+
+class TestTrainer(unittest.TestCase):
+    def test_resume_from_step_checkpoint(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            write_dataset(tmp_dir, 6)
+            # 3 batches per pass, the epoch continues into the next pass
+            config = get_toy_config(tmp_dir, Path(tmp_dir) / "full")
+            config["trainer"]["save_step_period"] = 2
+            config = ConfigParser(config, run_id="")
+            trainer = get_trainer(config, resumable=True, len_epoch=5)
+            batches = train(trainer)
+            self.assertEqual(len(batches), 5)
+            checkpoint_path = str(config.save_dir / "checkpoint-epoch1-step2.pth")
+
+            resumed_config = get_toy_config(tmp_dir, Path(tmp_dir) / "resumed")
+            resumed_config["trainer"]["save_step_period"] = 2
+            resumed_config = ConfigParser(resumed_config, resume=checkpoint_path, use_previous_optimizer=True, run_id="")
+            resumed_trainer = get_trainer(resumed_config, resumable=True, len_epoch=5)
+            # the resumed run trains the same remaining batches to the same weights
+            self.assertEqual(train(resumed_trainer), batches[2:])
+            for p, resumed_p in zip(trainer.model.parameters(), resumed_trainer.model.parameters()):
+                self.assertTrue(torch.allclose(p, resumed_p))
+
+    def test_step_checkpoints_without_resumable_sampler(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            write_dataset(tmp_dir, 4)
+            config = get_toy_config(tmp_dir, Path(tmp_dir) / "saved")
+            config["trainer"]["save_step_period"] = 2
+            with self.assertLogs("trainer", "WARNING"):
+                get_trainer(ConfigParser(config, run_id=""))
+
+    def test_ema_skips_inf_steps(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            write_dataset(tmp_dir, 4)
+            config = get_toy_config(tmp_dir, Path(tmp_dir) / "saved")
+            config["trainer"]["ema"] = {"decay": 0.5}
+            trainer = get_trainer(ConfigParser(config, run_id=""))
+            ema_params = [p.clone() for p in trainer.ema.module.parameters()]
+
+            # the scale is decreased by the gradient scaler when gradients have inf or nan
+            trainer.scaler = mock.Mock(wraps=trainer.scaler)
+            trainer.scaler.get_scale.side_effect = [2.0, 1.0]
+            trainer.process_batch(get_batch(), True, 0, trainer.train_metrics)
+            self.assertEqual(trainer.ema.steps, 0)
+            for p, ema_p in zip(trainer.ema.module.parameters(), ema_params):
+                self.assertTrue(torch.equal(p, ema_p))
+
+            trainer.scaler.get_scale.side_effect = [1.0, 1.0]
+            trainer.process_batch(get_batch(), True, 0, trainer.train_metrics)
+            self.assertEqual(trainer.ema.steps, 1)
+            for p, ema_p, model_p in zip(trainer.ema.module.parameters(), ema_params, trainer.model.parameters()):
+                self.assertTrue(torch.allclose(p, (ema_p + model_p) / 2))
@@ -1,8 +1,13 @@
 import platform
 import shutil
 from contextlib import contextmanager
+from pathlib import Path
 from time import sleep
 
+import torch
+import torchaudio
+from torch import nn
+
 from src.utils.parse_config import ConfigParser
 
 
@@ -20,3 +25,60 @@ def clear_log_folder_after_use(config_parser: ConfigParser):
         else:
             shutil.rmtree(config_parser.save_dir)
             shutil.rmtree(config_parser.log_dir)
+
+
+class ToyModel(nn.Module):
+    def __init__(self):
+        super().__init__()
+        torch.manual_seed(0)
+        self.net = nn.Sequential(nn.Linear(8, 16), nn.ReLU(), nn.Linear(16, 8))
+
+    def forward(self, y_wav, **batch):
+        return {"s1": self.net(y_wav)}
+
+
+def toy_loss(s1, target_wav, **batch):
+    return nn.functional.mse_loss(s1, target_wav)
+
+
+def write_dataset(data_dir, size):
+    # every item is a constant wave of its (id + 1) / 10, so items can be told apart in batches,
+    # collated waves with the prepended zero sample are inputs of ToyModel
+    for i in range(size):
+        wave = torch.full((1, 7), (i + 1) / 10)
+        for suffix in ["mixed", "ref", "target"]:
+            torchaudio.save(str(Path(data_dir) / f"{i}-{suffix}.wav"), wave, 16000)
+
+
+def get_item_ids(batch):
+    return [round(10 * wave[1].item()) - 1 for wave in batch["y_wav"]]
+
+
+def get_toy_config(data_dir, save_dir, name="toy_test"):
+    """
+    Config of a fp32 cpu run over the dataset of write_dataset, which is the "val" split.
+    """
+    return {
+        "name": name,
+        "arch": {"type": "ToyModel", "args": {}},
+        "preprocessing": {"sr": 16000, "spectrogram": {"type": "MelSpectrogram", "args": {}}, "log_spec": True},
+        "data": {
+            "val": {
+                "batch_size": 2,
+                "num_workers": 0,
+                "pin_memory": False,
+                "datasets": [{"type": "CustomDirAudioDataset", "args": {"mix_dir": data_dir, "ref_dir": data_dir, "target_dir": data_dir}}],
+            }
+        },
+        "optimizer": {"type": "SGD", "args": {"lr": 0.1, "momentum": 0.9}},
+        "lr_scheduler": {"type": "StepLR", "args": {"step_size": 3, "gamma": 0.5}},
+        "trainer": {
+            "epochs": 1,
+            "save_dir": str(save_dir),
+            "save_period": 1,
+            "verbosity": 2,
+            "monitor": "off",
+            "visualize": "none",
+            "precision": "fp32",
+        },
+    }
@@ -1,15 +1,11 @@
-from typing import List, NamedTuple
+from typing import List
 
+import numpy as np
 import torch
 
+from ctc_decoding import Hypothesis, ctc_decode_batch, ctc_prefix_beam_search, to_numpy
 from src.base.base_text_encoder import BaseTextEncoder
 from .char_text_encoder import CharTextEncoder
-from collections import defaultdict
-
-
-class Hypothesis(NamedTuple):
-    text: str
-    prob: float
 
 
 class CTCCharTextEncoder(CharTextEncoder):
@@ -32,48 +28,22 @@ class CTCCharTextEncoder(CharTextEncoder):
             last_char = cur_char
         return "".join(result)
 
-    def ctc_beam_search(self, probs: torch.tensor, beam_size: int) -> str:
+    def ctc_decode_batch(self, log_probs: torch.Tensor, lengths=None) -> List[str]:
         """
-        Performs beam search and returns a list of pairs (hypothesis, hypothesis probability).
+        Greedy decoding of B x T x V log-probabilities on their device, see ctc_decoding.ctc_decode_batch.
         """
-        assert len(probs.shape) == 2
-        char_length, voc_size = probs.shape
-        assert voc_size == len(self.ind2char)
-        hypos: List[Hypothesis] = []
-        # TODO: your code here
-
-        def extend_and_merge(frame, state):
-            new_state = defaultdict(float)
-            for next_char_index, next_char_proba in enumerate(frame):
-                for (pref, last_char), pref_proba in state.items():
-                    next_char = self.ind2char[next_char_index]
-                    if next_char == last_char:
-                        new_pref = pref
-                    else:
-                        if next_char != self.EMPTY_TOK:
-                            new_pref = pref + next_char
-                        else:
-                            new_pref = pref
-                        last_char = next_char
-                    new_state[(new_pref, last_char)] += pref_proba * next_char_proba
-            return new_state
+        return ctc_decode_batch(log_probs, self.ind2char, self.char2ind[self.EMPTY_TOK], lengths)
 
-        def truncate(state, beam_size):
-            state_list = list(state.items())
-            state_list.sort(key=lambda x: -x[1])
-            return dict(state_list[:beam_size])
-
-        state = {("", self.EMPTY_TOK): 1.0}
-        for frame in probs:
-            state = extend_and_merge(frame, state)
-            state = truncate(state, beam_size)
-        state_list = list(state.items())
-        state_list.sort(key=lambda x: -x[1])
-
-        # for state in state_list:
-        #     hypos.append(Hypothesis(state[0][0], state[1]))
+    def ctc_beam_search(self, probs: torch.tensor, beam_size: int, top_k: int = None) -> str:
+        """
+        Performs CTC prefix beam search over T x V frame probabilities and returns the most probable text.
+        """
+        with np.errstate(divide="ignore"):
+            log_probs = np.log(to_numpy(probs))
+        return self.ctc_prefix_beam_search(log_probs, beam_size, top_k)[0].text
 
-        return state_list[0][0][0]
+    def ctc_prefix_beam_search(self, log_probs, beam_size: int, top_k: int = None) -> List[Hypothesis]:
+        return ctc_prefix_beam_search(log_probs, self.ind2char, self.char2ind[self.EMPTY_TOK], beam_size, top_k)
 
     def ctc_lm_beam_search(self, logits: torch.tensor) -> str:
         assert self.decoder is not None
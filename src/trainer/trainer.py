@@ -1,16 +1,20 @@
+import contextlib
+import itertools
 import random
 from tqdm import tqdm
 
-import PIL
-import pandas as pd
-import numpy as np
 import torch
-from torchvision.transforms import ToTensor
-import pyloudnorm as pyln
+from torch.nn.parallel import DistributedDataParallel
 
 from src.base import BaseTrainer
+from src.batch_sampler import ResumableSampler
+from src.logger.prediction_logger import AsyncPredictionLogger
 from src.logger.utils import plot_spectrogram_to_buf
-from src.utils import inf_loop, MetricTracker
+from src.utils import normalize_audio, MetricTracker
+from src.utils.distributed import is_distributed, is_main_process, unwrap_model
+from src.utils.ema import ModelEMA
+from src.utils.precision import autocast, resolve_precision
+from src.utils.prefetcher import BatchPrefetcher, move_batch_to_device
 
 
 class Trainer(BaseTrainer):
@@ -34,66 +38,136 @@ class Trainer(BaseTrainer):
         super().__init__(model, criterion, metrics, optimizer, lr_scheduler, config, device)
         self.skip_oom = skip_oom
         self.config = config
-        self.train_dataloader = dataloaders["train"]
+        self.iters_to_accumulate = config["trainer"].get("iters_to_accumulate", 1)
+        self.train_dataloader = BatchPrefetcher(dataloaders["train"], device)
+        self.train_sampler = dataloaders["train"].sampler if isinstance(dataloaders["train"].sampler, ResumableSampler) else None
+        # pass over the train split and the number of its consumed samples, saved in checkpoints
+        self.train_position = None
+        self.train_batches = self._iterate_train()
         if len_epoch is None:
             # epoch-based training
             self.len_epoch = len(self.train_dataloader)
         else:
             # iteration-based training
-            self.train_dataloader = inf_loop(self.train_dataloader)
             self.len_epoch = len_epoch
-        self.evaluation_dataloaders = {k: v for k, v in dataloaders.items() if k != "train"}
+        if self.save_step_period is not None:
+            assert self.save_step_period % self.iters_to_accumulate == 0, "Step checkpoints are saved only after optimizer steps"
+            if self.train_sampler is None:
+                self.logger.warning(
+                    "Warning: Train split has no ResumableSampler (e.g. a batch_sampler is used), step checkpoints don't save "
+                    "the data position. Training resumed from them restarts the pass over data, so samples are repeated or skipped."
+                )
+        self.evaluation_dataloaders = {k: BatchPrefetcher(v, device) for k, v in dataloaders.items() if k != "train"}
         self.log_step = 100
 
-        self.iters_to_accumulate = config["trainer"].get("iters_to_accumulate", 1)
-        self.scaler = torch.cuda.amp.GradScaler()
+        # fp32, fp16 with gradient scaling or bf16
+        self.precision = resolve_precision(config["trainer"].get("precision", "fp16"), device)
+        self.scaler = torch.cuda.amp.GradScaler(enabled=self.precision == "fp16")
 
         self.train_metrics = MetricTracker("loss", "grad norm", *[m.name for m in self.metrics if not m.skip_on_train], writer=self.writer)
         self.evaluation_metrics = MetricTracker(*[m.name for m in self.metrics if not m.skip_on_test], writer=self.writer)
 
-        self.meter = pyln.Meter(config["preprocessing"].get("sr", 16000))
+        # exponential moving average of weights, {"decay": 0.999, "update_every": 1, "side_stream": false}
+        self.ema = ModelEMA(self.model, **config["trainer"]["ema"]) if config["trainer"].get("ema") is not None else None
+
+        self.prediction_logger = None
+        if self.writer is not None:
+            self.prediction_logger = AsyncPredictionLogger(
+                self.writer,
+                self.metrics,
+                max_queue_size=config["trainer"].get("log_queue_size", 4),
+                sample_rate=config["preprocessing"].get("sr", 16000),
+            )
+
+    def _iterate_train(self):
+        """
+        Endless iteration over train batches, epochs may end in the middle of a pass
+        """
+        while True:
+            if self.train_sampler is not None:
+                self.train_position = {"pass": self.train_sampler.pass_idx, "offset": self.train_sampler.start_offset}
+            for batch in self.train_dataloader:
+                if self.train_position is not None:
+                    self.train_position["offset"] += batch["y_wav"].shape[0]
+                yield batch
+
+    def _train_state(self):
+        return {
+            "scaler": self.scaler.state_dict(),
+            "sampler": dict(self.train_position) if self.train_position is not None else None,
+            "ema_state_dict": self.ema.state_dict() if self.ema is not None else None,
+        }
+
+    def _load_train_state(self, checkpoint):
+        # disabled scalers (fp32, bf16) save an empty state, a fp16 run then starts with a fresh scale
+        if checkpoint.get("scaler") and self.scaler.is_enabled():
+            self.scaler.load_state_dict(checkpoint["scaler"])
+        if self.ema is not None:
+            if checkpoint.get("ema_state_dict") is not None:
+                self.ema.load_state_dict(checkpoint["ema_state_dict"])
+            else:
+                # averaging starts from the resumed weights
+                self.ema.module.load_state_dict(unwrap_model(self.model).state_dict())
+        if checkpoint.get("sampler") is not None and self.train_sampler is not None:
+            self.train_sampler.pass_idx = checkpoint["sampler"]["pass"]
+            self.train_sampler.start_offset = checkpoint["sampler"]["offset"]
 
     @staticmethod
     def move_batch_to_device(batch, device: torch.device):
         """
-        Move all necessary tensors to the HPU
+        Move all necessary tensors to the HPU, batches from BatchPrefetcher are already there
         """
-        for tensor_for_gpu in ["y_wav", "x_wav", "target_wav"]:
-            batch[tensor_for_gpu] = batch[tensor_for_gpu].to(device)
-        return batch
+        return move_batch_to_device(batch, device)
 
     def _clip_grad_norm(self):
+        """
+        :return: total gradient norm before clipping as a device tensor.
+        """
         if self.config["trainer"].get("grad_norm_clip", None) is not None:
-            torch.nn.utils.clip_grad_norm_(self.model.parameters(), self.config["trainer"]["grad_norm_clip"])
+            total_norm = torch.nn.utils.clip_grad_norm_(self.model.parameters(), self.config["trainer"]["grad_norm_clip"])
+            return torch.nan_to_num(total_norm.detach(), nan=0)
+        return self.get_grad_norm()
 
     def process_batch(self, batch, is_train: bool, batch_idx: int, metrics: MetricTracker):
         batch = self.move_batch_to_device(batch, self.device)
-        with torch.cuda.amp.autocast():
-            outputs = self.model(**batch)
-            batch.update(outputs)
+        optimizer_step = (batch_idx + 1) % self.iters_to_accumulate == 0 or (batch_idx + 1) == self.len_epoch
+        sync_context = contextlib.nullcontext()
+        if is_train and not optimizer_step and isinstance(self.model, DistributedDataParallel):
+            # gradients are all-reduced only on the last accumulated batch
+            sync_context = self.model.no_sync()
+        with sync_context:
+            with autocast(self.precision, self.device):
+                # evaluation uses averaged weights when EMA is enabled
+                model = self.model if is_train or self.ema is None else self.ema.module
+                outputs = model(**batch)
+                batch.update(outputs)
+                if is_train:
+                    batch["loss"] = self.criterion(**batch) / self.iters_to_accumulate
             if is_train:
-                batch["loss"] = self.criterion(**batch) / self.iters_to_accumulate
-        if is_train:
-            self.scaler.scale(batch["loss"]).backward()
+                self.scaler.scale(batch["loss"]).backward()
 
-            if (batch_idx + 1) % self.iters_to_accumulate == 0 or (batch_idx + 1) == self.len_epoch:
+        if is_train:
+            if optimizer_step:
                 self.scaler.unscale_(self.optimizer)
-                self._clip_grad_norm()
+                grad_norm = self._clip_grad_norm()
+                if self.ema is not None:
+                    # the previous EMA update on the side stream must read parameters before they change
+                    self.ema.wait()
+                scale = self.scaler.get_scale()
                 self.scaler.step(self.optimizer)
                 self.scaler.update()
-                self.train_metrics.update("grad norm", self.get_grad_norm())
+                # the scale is decreased only when the step was skipped because of inf or nan gradients
+                if self.ema is not None and self.scaler.get_scale() >= scale:
+                    self.ema.update()
+                if grad_norm is not None:
+                    self.train_metrics.update("grad norm", grad_norm)
                 self.optimizer.zero_grad()
 
             if self.lr_scheduler is not None:
                 self.lr_scheduler.step()
-            metrics.update("loss", batch["loss"].item())
+            metrics.update("loss", batch["loss"].detach())
 
-        wavs = batch["s1"]
-        normalized_s = torch.zeros_like(batch["s1"], device=wavs.device)
-        for i in range(wavs.shape[0]):
-            tensor_wav = torch.nan_to_num(wavs[i], nan=0)
-            normalized_s[i] = (20 * tensor_wav / tensor_wav.norm()).to(torch.float32)
-        batch.update({"normalized_s": normalized_s})
+        batch.update({"normalized_s": normalize_audio(batch["s1"], batch.get("y_wav_len"))})
 
         for metric in self.metrics:
             # if not is_train and metric.skip_on_test:
@@ -102,6 +176,10 @@ class Trainer(BaseTrainer):
             #     continue
             if is_train and metric.name == "PESQ":
                 continue
+            if not is_train and hasattr(metric, "submit"):
+                # scored in background, gathered at the end of evaluation epoch
+                metric.submit(**batch)
+                continue
             metrics.update(metric.name, metric(**batch))
         return batch
 
@@ -113,17 +191,38 @@ class Trainer(BaseTrainer):
         :return: A log that contains information about validation
         """
         self.model.eval()
+        if self.ema is not None:
+            self.ema.wait()
         self.evaluation_metrics.reset()
         with torch.no_grad():
-            for batch_idx, batch in tqdm(enumerate(dataloader), desc=part, total=len(dataloader)):
+            for batch_idx, batch in tqdm(enumerate(dataloader), desc=part, total=len(dataloader), disable=not is_main_process()):
                 batch = self.process_batch(batch, False, 0, metrics=self.evaluation_metrics)
-            self.writer.set_step(epoch * self.len_epoch, part)
+            for metric in self.metrics:
+                if hasattr(metric, "gather"):
+                    value, count = metric.gather()
+                    if count > 0:
+                        self.evaluation_metrics.update(metric.name, value, n=count)
+            if is_distributed():
+                self.evaluation_metrics.all_reduce(self.device)
+            if self.writer is not None:
+                self.writer.set_step(epoch * self.len_epoch, part)
             self._log_predictions(False, **batch)
             # self._log_spectrogram(batch["spectrogram"])
             self._log_scalars(self.evaluation_metrics)
 
         return self.evaluation_metrics.result()
 
+    def train(self):
+        try:
+            super().train()
+        finally:
+            if self.prediction_logger is not None:
+                self.prediction_logger.close()
+            # PESQ metrics own process pools
+            for metric in self.metrics:
+                if hasattr(metric, "close"):
+                    metric.close()
+
     def _progress(self, batch_idx):
         base = "[{}/{} ({:.0f}%)]"
         if hasattr(self.train_dataloader, "n_samples"):
@@ -135,59 +234,26 @@ class Trainer(BaseTrainer):
         return base.format(current, total, 100.0 * current / total)
 
     def _log_predictions(self, is_train, **batch):
-        y_wav = batch["y_wav"]
-        x_wav = batch["x_wav"]
-        target_wav = batch["target_wav"]
-        normalized_s = batch["normalized_s"]
-        if self.writer is None:
+        if self.prediction_logger is None:
             return
-        batch_size = y_wav.shape[0]
-        examples_to_log = min(2, batch_size)
-        ids = np.random.choice(batch_size, examples_to_log, replace=False)
-
-        def get_wandb_audio(tensor):
-            return self.writer.wandb.Audio(tensor.detach().to(torch.float32).cpu().numpy(), sample_rate=16000)
-
-        def get_i_tensors_for_metrics(i, **batch):
-            out = {}
-            for key, value in batch.items():
-                if torch.is_tensor(value) and key != "loss":
-                    out[key] = value[i].unsqueeze(0)
-            return out
-
-        rows = {}
-        for i in ids:
-            rows[i] = {
-                "norm_pred": get_wandb_audio(normalized_s[i]),
-                "mixed": get_wandb_audio(y_wav[i]),
-                "ref": get_wandb_audio(x_wav[i]),
-                "target": get_wandb_audio(target_wav[i]),
-            }
-            for metric in self.metrics:
-                if not is_train and metric.skip_on_test:
-                    continue
-                kwargs = get_i_tensors_for_metrics(i, **batch)
-                rows[i].update({metric.name: metric(**kwargs)})
-
-        self.writer.add_table("predictions", pd.DataFrame.from_dict(rows, orient="index"))
+        self.prediction_logger.log(self.writer.step, self.writer.mode, is_train, **batch)
 
     def _log_spectrogram(self, spectrogram_batch):
+        from PIL import Image
+        from torchvision.transforms import ToTensor
+
         spectrogram = random.choice(spectrogram_batch.cpu())
-        image = PIL.Image.open(plot_spectrogram_to_buf(spectrogram))
+        image = Image.open(plot_spectrogram_to_buf(spectrogram))
         self.writer.add_image("spectrogram", ToTensor()(image))
 
     @torch.no_grad()
     def get_grad_norm(self, norm_type=2):
-        parameters = self.model.parameters()
-        if isinstance(parameters, torch.Tensor):
-            parameters = [parameters]
-        parameters = [p for p in parameters if p.grad is not None]
-
-        total_norm = torch.norm(
-            torch.stack([torch.norm(torch.nan_to_num(p.grad.detach(), nan=0), norm_type).cpu() for p in parameters]),
-            norm_type,
-        )
-        return total_norm.item()
+        grads = [p.grad.detach() for p in self.model.parameters() if p.grad is not None]
+        if len(grads) == 0:
+            return None
+        # one fused kernel over all gradients, the result stays on device
+        norms = torch.nan_to_num(torch.stack(torch._foreach_norm(grads, norm_type)), nan=0)
+        return torch.linalg.vector_norm(norms, norm_type)
 
     def _log_scalars(self, metric_tracker: MetricTracker):
         if self.writer is None:
@@ -204,8 +270,14 @@ class Trainer(BaseTrainer):
         """
         self.model.train()
         self.train_metrics.reset()
-        self.writer.add_scalar("epoch", epoch)
-        for batch_idx, batch in enumerate(tqdm(self.train_dataloader, desc="train", total=self.len_epoch)):
+        if self.writer is not None:
+            self.writer.add_scalar("epoch", epoch)
+        start_step = self.start_step if epoch == self.start_epoch else 0
+        last_train_metrics = {}
+        batches = itertools.islice(self.train_batches, self.len_epoch - start_step)
+        for batch_idx, batch in enumerate(
+            tqdm(batches, desc="train", total=self.len_epoch, initial=start_step, disable=not is_main_process()), start=start_step
+        ):
             try:
                 batch = self.process_batch(batch, True, batch_idx, metrics=self.train_metrics)
             except RuntimeError as e:
@@ -219,9 +291,10 @@ class Trainer(BaseTrainer):
                 else:
                     raise e
             if batch_idx % self.log_step == 0:
-                self.writer.set_step((epoch - 1) * self.len_epoch + batch_idx)
                 self.logger.debug("Train Epoch: {} {} Loss: {:.6f}".format(epoch, self._progress(batch_idx), batch["loss"].item()))
-                self.writer.add_scalar("learning rate", self.lr_scheduler.get_last_lr()[0])
+                if self.writer is not None:
+                    self.writer.set_step((epoch - 1) * self.len_epoch + batch_idx)
+                    self.writer.add_scalar("learning rate", self.lr_scheduler.get_last_lr()[0])
                 self._log_predictions(True, **batch)
                 self._log_scalars(self.train_metrics)
                 # we don't want to reset train metrics at the start of every epoch
@@ -229,8 +302,13 @@ class Trainer(BaseTrainer):
                 last_train_metrics = self.train_metrics.result()
                 self.train_metrics.reset()
 
+            self._last_step = batch_idx + 1
+            if self.save_step_period is not None and (batch_idx + 1) % self.save_step_period == 0 and batch_idx + 1 < self.len_epoch:
+                self._save_checkpoint(epoch, step=batch_idx + 1)
+
             if batch_idx + 1 >= self.len_epoch:
                 break
+        self._last_step = None
 
         log = last_train_metrics
 
@@ -0,0 +1,132 @@
+import logging
+import os
+import queue
+import random
+import shutil
+import threading
+from collections import deque
+from pathlib import Path
+
+import numpy as np
+import torch
+
+logger = logging.getLogger(__name__)
+
+
+def snapshot_to_cpu(state):
+    """
+    Copies all tensors of the nested state to cpu, so training may continue modifying them.
+    Copies from gpu are asynchronous, they are complete after the next cuda synchronization.
+    """
+    if torch.is_tensor(state):
+        if state.is_cuda:
+            return state.detach().to("cpu", non_blocking=True)
+        return state.detach().clone()
+    if isinstance(state, dict):
+        return type(state)((key, snapshot_to_cpu(value)) for key, value in state.items())
+    if isinstance(state, (list, tuple)):
+        return type(state)(snapshot_to_cpu(value) for value in state)
+    return state
+
+
+class AsyncCheckpointWriter:
+    """
+    Saves checkpoints from a background thread. Every file is written to a temporary path
+    and atomically renamed, so an interrupted save never leaves a broken checkpoint. Only
+    the last `keep_last` checkpoints are kept, model_best.pth is a hard link to the best one
+    (a copy on filesystems without hard links), so it outlives the removal of that checkpoint.
+    """
+
+    def __init__(self, checkpoint_dir, keep_last=None, max_queue_size=2):
+        self.checkpoint_dir = Path(checkpoint_dir)
+        self.keep_last = keep_last
+        self._saved = deque()
+        # bounded, so at most max_queue_size snapshots are held in memory
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._worker = threading.Thread(target=self._work, daemon=True)
+        self._worker.start()
+
+    def save(self, state, filename, save_best=False):
+        """
+        :param filename: name of the checkpoint in checkpoint_dir.
+        :param save_best: if True, model_best.pth is linked to the checkpoint.
+        """
+        state = snapshot_to_cpu(state)
+        event = None
+        if torch.cuda.is_available():
+            event = torch.cuda.Event()
+            event.record()
+        self._queue.put((state, event, filename, save_best))
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                self._write(*item)
+            except Exception:
+                logger.exception("Checkpoint saving failed")
+            finally:
+                self._queue.task_done()
+
+    def _write(self, state, event, filename, save_best):
+        if event is not None:
+            event.synchronize()
+        path = self.checkpoint_dir / filename
+        self._atomic_save(state, path)
+        logger.info(f"Saving checkpoint: {path} ...")
+        if save_best:
+            self._link_best(path)
+            logger.info("Saving current best: model_best.pth ...")
+
+        if path in self._saved:
+            self._saved.remove(path)
+        self._saved.append(path)
+        while self.keep_last is not None and len(self._saved) > self.keep_last:
+            # model_best.pth stays valid, since it links to the file itself
+            self._saved.popleft().unlink(missing_ok=True)
+
+    def _link_best(self, path):
+        best_path = self.checkpoint_dir / "model_best.pth"
+        tmp_path = best_path.with_suffix(".tmp")
+        tmp_path.unlink(missing_ok=True)
+        try:
+            os.link(path, tmp_path)
+        except OSError:
+            # no hard links on the filesystem
+            shutil.copyfile(path, tmp_path)
+        os.replace(tmp_path, best_path)
+
+    @staticmethod
+    def _atomic_save(state, path):
+        tmp_path = path.with_suffix(".tmp")
+        torch.save(state, tmp_path)
+        os.replace(tmp_path, path)
+
+    def flush(self):
+        """
+        Waits until all queued checkpoints are written.
+        """
+        self._queue.join()
+
+    def close(self):
+        self.flush()
+        self._queue.put(None)
+        self._worker.join()
+
+
+def get_rng_state():
+    state = {"python": random.getstate(), "numpy": np.random.get_state(), "torch": torch.get_rng_state()}
+    if torch.cuda.is_available():
+        state["cuda"] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def set_rng_state(state):
+    random.setstate(state["python"])
+    np.random.set_state(state["numpy"])
+    # rng states must be cpu byte tensors, checkpoints may be loaded to gpu
+    torch.set_rng_state(state["torch"].cpu())
+    if torch.cuda.is_available() and "cuda" in state:
+        torch.cuda.set_rng_state_all([cuda_state.cpu() for cuda_state in state["cuda"]])
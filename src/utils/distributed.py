@@ -0,0 +1,63 @@
+import os
+from datetime import datetime
+
+import torch
+import torch.distributed as dist
+from torch.nn.parallel import DistributedDataParallel
+
+
+def init_distributed():
+    """
+    Initializes the default process group from the environment set by torchrun.
+    nccl is used with gpus, gloo on cpu.
+
+    :return: rank, world size and local rank, (0, 1, 0) without torchrun.
+    """
+    world_size = int(os.environ.get("WORLD_SIZE", 1))
+    if world_size == 1:
+        return 0, 1, 0
+    rank, local_rank = int(os.environ["RANK"]), int(os.environ["LOCAL_RANK"])
+    if torch.cuda.is_available():
+        torch.cuda.set_device(local_rank)
+        dist.init_process_group("nccl")
+    else:
+        dist.init_process_group("gloo")
+    return rank, world_size, local_rank
+
+
+def is_distributed():
+    return dist.is_available() and dist.is_initialized()
+
+
+def get_rank():
+    return dist.get_rank() if is_distributed() else 0
+
+
+def get_world_size():
+    return dist.get_world_size() if is_distributed() else 1
+
+
+def is_main_process():
+    return get_rank() == 0
+
+
+def broadcast_object(obj, src=0):
+    """
+    Returns obj of the src process on every process.
+    """
+    if not is_distributed():
+        return obj
+    objects = [obj]
+    dist.broadcast_object_list(objects, src=src)
+    return objects[0]
+
+
+def get_shared_run_id():
+    """
+    Timestamp run id of the rank 0 process, so all processes save to the same directories.
+    """
+    return broadcast_object(datetime.now().strftime(r"%m%d_%H%M%S"))
+
+
+def unwrap_model(model):
+    return model.module if isinstance(model, DistributedDataParallel) else model
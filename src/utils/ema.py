@@ -0,0 +1,70 @@
+import copy
+
+import torch
+
+from src.utils.distributed import unwrap_model
+
+
+class ModelEMA:
+    """
+    Exponential moving average of model weights. Every `update_every` optimizer steps all parameters
+    are updated by one fused foreach op on their device, buffers (BatchNorm statistics) are copied.
+    With `side_stream` the parameter update runs on a separate cuda stream and overlaps with the next
+    forward and backward passes, `wait` must be called before parameters are modified again. Buffers are
+    always copied on the current stream, since the next forward updates BatchNorm statistics in place.
+    """
+
+    def __init__(self, model, decay=0.999, update_every=1, side_stream=False):
+        model = unwrap_model(model)
+        self.module = copy.deepcopy(model).eval().requires_grad_(False)
+        self.decay = decay
+        self.update_every = update_every
+        self.steps = 0
+        self._model_params = list(model.parameters())
+        self._ema_params = list(self.module.parameters())
+        self._model_buffers = list(model.buffers())
+        self._ema_buffers = list(self.module.buffers())
+        device = self._ema_params[0].device
+        self.stream = torch.cuda.Stream(device) if side_stream and device.type == "cuda" else None
+
+    @torch.no_grad()
+    def _update_params(self):
+        # skipped steps are compensated, so the averaging horizon does not depend on update_every
+        weight = 1 - self.decay**self.update_every
+        torch._foreach_lerp_(self._ema_params, self._model_params, weight)
+
+    @torch.no_grad()
+    def _copy_buffers(self):
+        for ema_buffer, buffer in zip(self._ema_buffers, self._model_buffers):
+            ema_buffer.copy_(buffer)
+
+    def update(self):
+        """
+        Called after an optimizer step, steps skipped by the gradient scaler must not be averaged.
+        """
+        self.steps += 1
+        if self.steps % self.update_every != 0:
+            return
+        self._copy_buffers()
+        if self.stream is None:
+            self._update_params()
+            return
+        # parameters after the optimizer step are read on the side stream
+        self.stream.wait_stream(torch.cuda.current_stream(self.stream.device))
+        with torch.cuda.stream(self.stream):
+            self._update_params()
+
+    def wait(self):
+        """
+        Makes the current stream wait for the pending update.
+        """
+        if self.stream is not None:
+            torch.cuda.current_stream(self.stream.device).wait_stream(self.stream)
+
+    def state_dict(self):
+        self.wait()
+        return {"module": self.module.state_dict(), "steps": self.steps}
+
+    def load_state_dict(self, state_dict):
+        self.module.load_state_dict(state_dict["module"])
+        self.steps = state_dict["steps"]
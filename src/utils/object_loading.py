@@ -1,11 +1,14 @@
 from operator import xor
 
-from torch.utils.data import ConcatDataset, DataLoader
+import torch
+import torch.distributed.optim
+from torch.utils.data import ConcatDataset, DataLoader, DistributedSampler
 
 import src.augmentations
 import src.datasets
 from src import batch_sampler as batch_sampler_module
 from src.collate_fn.ss_collate import ss_collate_fn
+from src.utils.distributed import is_distributed
 from src.utils.parse_config import ConfigParser
 
 
@@ -13,6 +16,14 @@ def get_dataloaders(configs: ConfigParser):
     dataloaders = {}
     for split, params in configs["data"].items():
         num_workers = params.get("num_workers", 1)
+        # pinned batches are copied to gpu asynchronously by BatchPrefetcher
+        pin_memory = params.get("pin_memory", torch.cuda.is_available())
+        # worker options are accepted by DataLoader only with multiprocess loading
+        worker_kwargs = {}
+        if num_workers > 0:
+            worker_kwargs["persistent_workers"] = params.get("persistent_workers", False)
+            if params.get("prefetch_factor") is not None:
+                worker_kwargs["prefetch_factor"] = params["prefetch_factor"]
 
         # set train augmentations
         if split == "train":
@@ -44,6 +55,7 @@ def get_dataloaders(configs: ConfigParser):
                 shuffle = params["shuffle"]
             batch_sampler = None
         elif "batch_sampler" in params:
+            assert not is_distributed(), "Batch samplers are not supported in distributed training"
             batch_sampler = configs.init_obj(params["batch_sampler"], batch_sampler_module, data_source=dataset)
             bs, shuffle = 1, False
         else:
@@ -52,15 +64,41 @@ def get_dataloaders(configs: ConfigParser):
         # Fun fact. An hour of debugging was wasted to write this line
         assert bs <= len(dataset), f"Batch size ({bs}) shouldn't be larger than dataset length ({len(dataset)})"
 
+        # every process loads its own shard, evaluation metrics are reduced over processes
+        sampler = None
+        if split == "train" and batch_sampler is None:
+            # position in the train split is saved in step checkpoints
+            sampler = batch_sampler_module.ResumableSampler(dataset, shuffle=shuffle, seed=params.get("seed", 0), drop_last=drop_last)
+            shuffle = False
+        elif is_distributed() and batch_sampler is None:
+            sampler = DistributedSampler(dataset, shuffle=shuffle, drop_last=drop_last)
+            shuffle = False
+
         # create dataloader
         dataloader = DataLoader(
             dataset,
             batch_size=bs,
             shuffle=shuffle,
+            sampler=sampler,
             num_workers=num_workers,
             collate_fn=ss_collate_fn,
             batch_sampler=batch_sampler,
             drop_last=drop_last,
+            pin_memory=pin_memory,
+            **worker_kwargs,
         )
         dataloaders[split] = dataloader
     return dataloaders
+
+
+def get_optimizer(configs: ConfigParser, params):
+    """
+    Builds config["optimizer"] over params. With "zero": true it is wrapped in ZeroRedundancyOptimizer.
+    """
+    if configs["optimizer"].get("zero", False):
+        # every process keeps optimizer state only for its shard of parameters
+        assert is_distributed(), "Sharded optimizer requires distributed training"
+        optimizer_dict = {"type": "ZeroRedundancyOptimizer", "args": configs["optimizer"]["args"]}
+        optimizer_class = getattr(torch.optim, configs["optimizer"]["type"])
+        return configs.init_obj(optimizer_dict, torch.distributed.optim, list(params), optimizer_class=optimizer_class)
+    return configs.init_obj(configs["optimizer"], torch.optim, params)
@@ -12,6 +12,7 @@ from src.base.base_text_encoder import BaseTextEncoder
 from src.logger import setup_logging
 from src.text_encoder import CTCCharTextEncoder
 from src.utils import read_json, write_json, ROOT_PATH
+from src.utils.distributed import is_distributed, is_main_process
 
 
 class ConfigParser:
@@ -43,19 +44,21 @@ class ConfigParser:
         self._log_dir = str(save_dir / "log" / exper_name / run_id)
 
         # make directory for saving checkpoints and log.
-        exist_ok = run_id == ""
+        # distributed processes share run_id, so they create the same directories
+        exist_ok = run_id == "" or is_distributed()
         self.save_dir.mkdir(parents=True, exist_ok=exist_ok)
         self.log_dir.mkdir(parents=True, exist_ok=exist_ok)
 
         # save updated config file to the checkpoint dir
-        write_json(self.config, self.save_dir / "config.json")
+        if is_main_process():
+            write_json(self.config, self.save_dir / "config.json")
 
         # configure logging module
         setup_logging(self.log_dir)
         self.log_levels = {0: logging.WARNING, 1: logging.INFO, 2: logging.DEBUG}
 
     @classmethod
-    def from_args(cls, args, options=""):
+    def from_args(cls, args, options="", run_id=None):
         """
         Initialize this class from some cli arguments. Used in train, test.
         """
@@ -86,7 +89,7 @@ class ConfigParser:
 
         # parse custom cli options into dictionary
         modification = {opt.target: getattr(args, _get_opt_name(opt.flags)) for opt in options}
-        return cls(config, resume, use_previous_optimizer, modification)
+        return cls(config, resume, use_previous_optimizer, modification, run_id)
 
     @staticmethod
     def init_obj(obj_dict, default_module, *args, **kwargs):
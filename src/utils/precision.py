@@ -0,0 +1,28 @@
+import contextlib
+import logging
+
+import torch
+
+AUTOCAST_DTYPES = {"fp32": None, "fp16": torch.float16, "bf16": torch.bfloat16}
+
+logger = logging.getLogger(__name__)
+
+
+def resolve_precision(precision: str, device: torch.device) -> str:
+    """
+    Checks the precision policy, fp16 autocast is used only on cuda and falls back to fp32 on cpu.
+    """
+    assert precision in AUTOCAST_DTYPES, f"Unknown precision {precision}, choose one of {list(AUTOCAST_DTYPES)}"
+    if precision == "fp16" and device.type != "cuda":
+        logger.warning("fp16 mixed precision is supported only on cuda, training in fp32.")
+        return "fp32"
+    return precision
+
+
+def autocast(precision: str, device: torch.device):
+    """
+    Autocast context of the precision policy. Only fp16 needs a gradient scaler, bf16 has the fp32 range.
+    """
+    if AUTOCAST_DTYPES[precision] is None:
+        return contextlib.nullcontext()
+    return torch.autocast(device_type=device.type, dtype=AUTOCAST_DTYPES[precision])
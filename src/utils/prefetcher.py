@@ -0,0 +1,52 @@
+import torch
+
+DEVICE_KEYS = ["y_wav", "y_wav_len", "x_wav", "x_wav_len", "target_wav", "speaker_id"]
+
+
+def move_batch_to_device(batch, device: torch.device, non_blocking=False):
+    for key in DEVICE_KEYS:
+        if key in batch:
+            batch[key] = batch[key].to(device, non_blocking=non_blocking)
+    return batch
+
+
+class BatchPrefetcher:
+    """
+    Wraps a dataloader and copies the next batch to the device on a side cuda stream while
+    the current batch is processed. Copies are asynchronous only for pinned batches, so the
+    dataloader should be created with pin_memory=True. On cpu batches are moved synchronously.
+    """
+
+    def __init__(self, dataloader, device: torch.device):
+        self.dataloader = dataloader
+        self.device = device
+
+    def __len__(self):
+        return len(self.dataloader)
+
+    def _preload(self, iterator, stream):
+        batch = next(iterator, None)
+        if batch is None:
+            return None
+        with torch.cuda.stream(stream):
+            return move_batch_to_device(batch, self.device, non_blocking=True)
+
+    def __iter__(self):
+        if self.device.type != "cuda":
+            for batch in self.dataloader:
+                yield move_batch_to_device(batch, self.device)
+            return
+
+        stream = torch.cuda.Stream(self.device)
+        current_stream = torch.cuda.current_stream(self.device)
+        iterator = iter(self.dataloader)
+        next_batch = self._preload(iterator, stream)
+        while next_batch is not None:
+            current_stream.wait_stream(stream)
+            batch = next_batch
+            for key in DEVICE_KEYS:
+                if key in batch:
+                    # memory allocated on the side stream must not be reused before the main stream is done with it
+                    batch[key].record_stream(current_stream)
+            next_batch = self._preload(iterator, stream)
+            yield batch
@@ -3,8 +3,8 @@ from collections import OrderedDict
 from itertools import repeat
 from pathlib import Path
 
-import pandas as pd
 import torch
+import torch.distributed as dist
 
 ROOT_PATH = Path(__file__).absolute().resolve().parent.parent.parent
 
@@ -52,28 +52,75 @@ def prepare_device(n_gpu_use):
     return device, list_ids
 
 
+def normalize_audio(wavs, lengths=None, scale=20.0, eps=1e-8):
+    """
+    Scales every waveform of the B x T batch to the L2 norm `scale` at once, nans are replaced with zeros.
+    Samples beyond `lengths` are zeroed and do not contribute to the norm, all-zero waveforms stay zero.
+    """
+    wavs = torch.nan_to_num(wavs.to(torch.float32), nan=0)
+    if lengths is not None:
+        wavs = wavs * (torch.arange(wavs.shape[-1], device=wavs.device) < lengths.to(wavs.device).unsqueeze(-1))
+    return scale * wavs / torch.linalg.vector_norm(wavs, dim=-1, keepdim=True).clamp(min=eps)
+
+
 class MetricTracker:
+    """
+    Running averages of metrics. Tensor values are accumulated on their device without
+    host synchronization, which happens only when averages are read.
+    """
+
     def __init__(self, *keys, writer=None):
         self.writer = writer
-        self._data = pd.DataFrame(index=keys, columns=["total", "counts", "average"])
+        self._keys = list(keys)
+        self._key_index = {key: i for i, key in enumerate(self._keys)}
         self.reset()
 
     def reset(self):
-        for col in self._data.columns:
-            self._data[col].values[:] = 0
+        # allocated on the device of the first tensor value
+        self._device_totals = None
+        self._host_totals = [0.0] * len(self._keys)
+        self._counts = [0] * len(self._keys)
 
     def update(self, key, value, n=1):
         # if self.writer is not None:
         #     self.writer.add_scalar(key, value)
-        self._data.total[key] += value * n
-        self._data.counts[key] += n
-        self._data.average[key] = self._data.total[key] / self._data.counts[key]
+        i = self._key_index[key]
+        if torch.is_tensor(value):
+            if self._device_totals is None:
+                self._device_totals = torch.zeros(len(self._keys), dtype=torch.float64, device=value.device)
+            self._device_totals[i] += value.detach().to(self._device_totals.device, torch.float64) * n
+        else:
+            self._host_totals[i] += value * n
+        self._counts[i] += n
+
+    def _totals(self):
+        if self._device_totals is None:
+            return self._host_totals
+        return [host + device for host, device in zip(self._host_totals, self._device_totals.tolist())]
 
     def avg(self, key):
-        return self._data.average[key]
+        i = self._key_index[key]
+        if self._counts[i] == 0:
+            return 0
+        total = self._host_totals[i]
+        if self._device_totals is not None:
+            total += self._device_totals[i].item()
+        return total / self._counts[i]
 
     def result(self):
-        return dict(self._data.average)
+        return {key: total / count if count > 0 else 0 for key, total, count in zip(self._keys, self._totals(), self._counts)}
+
+    def all_reduce(self, device):
+        """
+        Sums totals and counts over all processes of the default process group,
+        so every process gets averages over the whole distributed dataset.
+        """
+        values = torch.tensor([*self._totals(), *self._counts], dtype=torch.float64, device=device)
+        dist.all_reduce(values)
+        values = values.tolist()
+        self._device_totals = None
+        self._host_totals = values[: len(self._keys)]
+        self._counts = [int(count) for count in values[len(self._keys) :]]
 
     def keys(self):
-        return self._data.total.keys()
+        return list(self._keys)
@@ -1,37 +1,39 @@
 import argparse
 import json
+import time
 from pathlib import Path
 from tqdm import tqdm
 
 import torch
 import torch.nn.functional as F
+import torchaudio
 
 import src.datasets
-import src.model as ss_module_model
-import hw_asr.model as asr_module_model
 import src.metric as module_metric
-from src.trainer import Trainer
-from src.utils import MetricTracker
+from src.utils import MetricTracker, normalize_audio
 from src.collate_fn.ss_collate import ss_collate_fn
-from src.utils.object_loading import get_dataloaders
+from src.inference import OnnxSpExPlus, load_ss_model, quantize_model
 from src.utils.parse_config import ConfigParser
+from src.utils.prefetcher import move_batch_to_device
 
 
 def main(config, args):
     logger = config.get_logger("test")
 
-    # define cpu or gpu if possible
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    # define cpu or gpu if possible, quantized kernels are available only on cpu
+    device = torch.device("cuda" if torch.cuda.is_available() and not args.quantize and args.backend == "torch" else "cpu")
 
     # setup data_loader instances
     dataset = config.init_obj(config["data"]["test"]["datasets"][0], src.datasets, config_parser=config)
+    if args.asr_checkpoint is not None:
+        # language model decoding workers are forked before cuda is initialized
+        text_encoder = config.get_text_encoder()
 
     def load_model(arch, checkpoint):
+        import hw_asr.model as asr_module_model
+
         # build model architecture
-        if "ss" in arch:
-            model = config.init_obj(config[arch], ss_module_model)
-        else:
-            model = config.init_obj(config[arch], asr_module_model, n_class=len(text_encoder))
+        model = config.init_obj(config[arch], asr_module_model, n_class=len(text_encoder))
         logger.info(model)
 
         logger.info("Loading checkpoint...")
@@ -42,16 +44,29 @@ def main(config, args):
         model.load_state_dict(state_dict)
         logger.info("Checkpoint has been loaded.")
 
-        # prepare ss_model for testing
+        # prepare model for testing
         model = model.to(device)
         model.eval()
         return model
 
-    ss_model = load_model("ss_arch", args.ss_checkpoint)
+    if args.backend == "onnx":
+        logger.info(f"Loading ONNX model {args.onnx_model}...")
+        ss_model = OnnxSpExPlus(args.onnx_model, intra_op_num_threads=args.threads)
+    else:
+        # slim checkpoints from `export.py -f weights` are memory-mapped, training checkpoints are loaded fully
+        ss_model = load_ss_model(config, args.ss_checkpoint, device, ema=args.ema)
+        logger.info(ss_model)
+        if args.threads is not None:
+            torch.set_num_threads(args.threads)
+    if args.quantize:
+        logger.info("Quantizing model...")
+        calibration_batches = (ss_collate_fn([dataset[i]]) for i in range(min(args.calibration_batches, len(dataset))))
+        ss_model = quantize_model(ss_model, calibration_batches, backend=args.quantization_backend)
+        logger.info("Model has been quantized.")
     if args.asr_checkpoint is not None:
-        # text_encoder
-        text_encoder = config.get_text_encoder()
         asr_model = load_model("asr_arch", args.asr_checkpoint)
+        # features of separated and target waves are computed on the device, filterbanks are built once
+        wave2spec = config.init_obj(config["preprocessing"]["spectrogram"], torchaudio.transforms).to(device)
 
     segmentation = False
     metrics = []
@@ -64,35 +79,37 @@ def main(config, args):
                 metrics.append(config.init_obj(metric_dict, module_metric, text_encoder=text_encoder))
         else:
             metrics.append(config.init_obj(metric_dict, module_metric))
-    metrics_tracker = MetricTracker(*[m.name for m in metrics])
+    metrics_tracker = MetricTracker("inference time, ms", *[m.name for m in metrics])
 
     with torch.no_grad():
         for i, pre_batch in enumerate(tqdm(dataset)):
             batch = ss_collate_fn([pre_batch])
-            batch = Trainer.move_batch_to_device(batch, device)
+            batch = move_batch_to_device(batch, device)
 
             # basic metrics
+            if device.type == "cuda":
+                torch.cuda.synchronize()
+            start_time = time.perf_counter()
             outputs = ss_model(**batch)
+            if device.type == "cuda":
+                torch.cuda.synchronize()
+            metrics_tracker.update("inference time, ms", 1000 * (time.perf_counter() - start_time))
             batch.update(outputs)
 
             wav = batch["s1"]
-            normalized_s = torch.zeros_like(batch["s1"], device=wav.device)
-            for i in range(wav.shape[0]):
-                tensor_wav = torch.nan_to_num(wav[i], nan=0)
-                normalized_s[i] = (20 * tensor_wav / tensor_wav.norm()).to(torch.float32)
+            normalized_s = normalize_audio(wav, batch["y_wav_len"])
             batch.update({"normalized_s": normalized_s})
 
             # ASR
             if args.asr_checkpoint is not None:
-
-                def insert_logits(pref, wav):
-                    _, spectrogram = dataset.process_wave(wav.cpu())
-                    batch["spectrogram"] = spectrogram.to(device)
-                    batch["spectrogram_length"] = torch.Tensor([spectrogram.shape[1]]).to(device)
-                    batch[pref + "log_probs"] = F.log_softmax(asr_model(**batch)["logits"], dim=-1)
-
-                insert_logits("pred_", normalized_s)
-                insert_logits("target_", batch["target_wav"])
+                # separated and target waves are recognized in one forward pass
+                asr_len = min(normalized_s.shape[-1], batch["target_wav"].shape[-1])
+                spectrogram = wave2spec(torch.cat([normalized_s[:, :asr_len], batch["target_wav"][:, :asr_len].to(torch.float32)]))
+                if config["preprocessing"]["log_spec"]:
+                    spectrogram = torch.log(spectrogram + 1e-5)
+                spectrogram_length = torch.full((spectrogram.shape[0],), spectrogram.shape[-1], device=device)
+                log_probs = F.log_softmax(asr_model(spectrogram=spectrogram, spectrogram_length=spectrogram_length)["logits"], dim=-1)
+                batch["pred_log_probs"], batch["target_log_probs"] = log_probs.chunk(2)
                 batch["lengths"] = [len(batch["text"][0])]
 
             # Segmented
@@ -107,16 +124,27 @@ def main(config, args):
                     segmented_batch["x_wav"] = batch["x_wav"]
                     segmented_batch["x_wav_len"] = batch["x_wav_len"]
 
-                    segmented_wav = torch.nan_to_num(ss_model(**segmented_batch)["s1"], nan=0)
-                    segmented_wavs.append((20 * segmented_wav / segmented_wav.norm()).to(torch.float32))
+                    segmented_wavs.append(normalize_audio(ss_model(**segmented_batch)["s1"]))
                 batch.update({"segmented_s": torch.concatenate(segmented_wavs, dim=1)})
                 batch.update({"cut_target_wav": batch["target_wav"][0, :cut_len].unsqueeze(0)})
 
             for metric in metrics:
-                metrics_tracker.update(metric.name, metric(**batch))
+                if hasattr(metric, "submit"):
+                    # scored in background while the next items are separated
+                    metric.submit(**batch)
+                else:
+                    metrics_tracker.update(metric.name, metric(**batch))
 
     for metric in metrics:
-        name = metric.name
+        if hasattr(metric, "gather"):
+            value, count = metric.gather()
+            if count > 0:
+                metrics_tracker.update(metric.name, value, n=count)
+            metric.close()
+    if args.asr_checkpoint is not None and getattr(text_encoder, "lm_decoder", None) is not None:
+        text_encoder.lm_decoder.close()
+
+    for name in metrics_tracker.keys():
         line = f"{name}: {metrics_tracker.avg(name)}"
         logger.info(line)
 
@@ -142,6 +170,11 @@ if __name__ == "__main__":
         type=str,
         help="Path to audio speech recognition checkpoint",
     )
+    args.add_argument(
+        "--ema",
+        action="store_true",
+        help="Evaluate exponential moving average of speech separation weights",
+    )
     args.add_argument(
         "--test_data_folder",
         default=None,
@@ -162,7 +195,46 @@ if __name__ == "__main__":
         type=int,
         help="Number of workers for test dataloader",
     )
+    args.add_argument(
+        "-q",
+        "--quantize",
+        action="store_true",
+        help="Evaluate int8 post-training quantized speech separation model on cpu",
+    )
+    args.add_argument(
+        "--calibration_batches",
+        default=16,
+        type=int,
+        help="Number of test dataset items used for quantization calibration",
+    )
+    args.add_argument(
+        "--quantization_backend",
+        default="x86",
+        type=str,
+        help="Quantized engine: x86, fbgemm or qnnpack",
+    )
+    args.add_argument(
+        "-b",
+        "--backend",
+        default="torch",
+        choices=["torch", "onnx"],
+        help="Speech separation inference backend, onnx runs ONNX Runtime on cpu",
+    )
+    args.add_argument(
+        "--onnx_model",
+        default="test_model/ss_model.onnx",
+        type=str,
+        help="Path to ONNX speech separation model exported by export.py in reference mode",
+    )
+    args.add_argument(
+        "-t",
+        "--threads",
+        default=None,
+        type=int,
+        help="Number of intra-op threads for cpu inference",
+    )
     args = args.parse_args()
+    assert not (args.quantize and args.backend == "onnx"), "Quantization is supported only for torch backend"
 
     with Path(args.config).open() as f:
         config = ConfigParser(json.load(f))
@@ -3,13 +3,16 @@ import warnings
 
 import numpy as np
 import torch
+import torch.distributed as dist
+from torch.nn.parallel import DistributedDataParallel
 
 import src.loss as module_loss
 import src.metric as module_metric
 import src.model as module_arch
 from src.trainer import Trainer
 from src.utils import prepare_device
-from src.utils.object_loading import get_dataloaders
+from src.utils.distributed import get_shared_run_id, init_distributed, is_distributed
+from src.utils.object_loading import get_dataloaders, get_optimizer
 from src.utils.parse_config import ConfigParser
 
 warnings.filterwarnings("ignore", category=UserWarning)
@@ -22,7 +25,7 @@ torch.backends.cudnn.benchmark = False
 np.random.seed(SEED)
 
 
-def main(config):
+def main(config, local_rank=0):
     logger = config.get_logger("train")
 
     # setup data_loader instances
@@ -34,10 +37,20 @@ def main(config):
     logger.info(model)
 
     # prepare for (multi-device) GPU training
-    device, device_ids = prepare_device(config["n_gpu"])
-    model = model.to(device)
-    if len(device_ids) > 1:
-        model = torch.nn.DataParallel(model, device_ids=device_ids)
+    if is_distributed():
+        # one process per device, launched by torchrun
+        device = torch.device(f"cuda:{local_rank}" if torch.cuda.is_available() else "cpu")
+        model = model.to(device)
+        model = DistributedDataParallel(
+            model,
+            device_ids=[local_rank] if device.type == "cuda" else None,
+            find_unused_parameters=config["trainer"].get("find_unused_parameters", False),
+        )
+    else:
+        device, device_ids = prepare_device(config["n_gpu"])
+        model = model.to(device)
+        if len(device_ids) > 1:
+            model = torch.nn.DataParallel(model, device_ids=device_ids)
 
     # get function handles of loss and metrics
     loss_module = config.init_obj(config["loss"], module_loss).to(device)
@@ -46,7 +59,7 @@ def main(config):
     # build optimizer, learning rate scheduler. delete every line containing lr_scheduler for
     # disabling scheduler
     trainable_params = filter(lambda p: p.requires_grad, model.parameters())
-    optimizer = config.init_obj(config["optimizer"], torch.optim, trainable_params)
+    optimizer = get_optimizer(config, trainable_params)
     lr_scheduler = config.init_obj(config["lr_scheduler"], torch.optim.lr_scheduler, optimizer)
 
     trainer = Trainer(
@@ -63,6 +76,9 @@ def main(config):
 
     trainer.train()
 
+    if is_distributed():
+        dist.destroy_process_group()
+
 
 if __name__ == "__main__":
     args = argparse.ArgumentParser(description="PyTorch Template")
@@ -95,5 +111,6 @@ if __name__ == "__main__":
         help="indices of GPUs to enable (default: all)",
     )
 
-    config = ConfigParser.from_args(args)
-    main(config)
+    rank, world_size, local_rank = init_distributed()
+    config = ConfigParser.from_args(args, run_id=get_shared_run_id() if world_size > 1 else None)
+    main(config, local_rank)